@@ -1,9 +1,7 @@
 import datetime
 import random
+import threading
 
-from pandas.core.indexing import is_nested_tuple
-from proc_engine import adda52parser
-from proc_engine import pdf_to_text
 from proc_engine.adda52parser import Adda52Parser
 from proc_engine.helper_functions import Helper
 from proc_engine.pokerstarsparser import PokerStarsParser
@@ -12,7 +10,6 @@ import logging
 import proc_engine.__base__ as base
 import time
 import pandas as pd
-from proc_engine.pdf_to_text import convert_to_text
 from proc_engine import exceptions
 
 
@@ -22,6 +19,9 @@ class Main(object):
         self.base = base
         self.basedb = base.BaseDB()
         self.helper = Helper()
+        if base.configdict.get("WARM_UP_ON_START", False):
+            # Preload the hottest solver nodes without holding up startup
+            threading.Thread(target=self.helper.warm_up, daemon=True).start()
         self.root_logger = self.get_logger("root.log", logger_name="root")
         self.pokerstars_logger = self.get_logger(
             "pokerstars.log", logger_name="9stacks")
@@ -70,6 +70,7 @@ class Main(object):
                 # PDF format
                 # TODO: Add file size check as well
                 if not os.path.isfile(txt_filepath):
+                    from proc_engine.pdf_to_text import convert_to_text
                     file_contents = convert_to_text(pdf_filepath)
 
                     with open(txt_filepath, "w+") as f:
@@ -87,6 +88,12 @@ class Main(object):
                 # TODO: Continue
                 df.to_csv(csv_filepath)
                 print("Saved to filepath: {}".format(csv_filepath))
+                print("Lookup cache: {}, queries avoided: {}".format(
+                    self.helper.result_cache.stats(), self.helper.avoided_queries))
+                if self.helper.node_cache is not None:
+                    print("Node cache: {}".format(self.helper.node_cache.stats()))
+                if self.helper.disk_cache is not None:
+                    print("Disk cache: {}".format(self.helper.disk_cache.stats()))
                 res = self.basedb.update_file_metadata(
                     filename, is_processed=True, num_hands=len_segments, num_hands_processed=df.shape[0], processing_time=processing_time)
                 print("Commit to database: ", res)
@@ -103,6 +110,12 @@ class Main(object):
             if isinstance(df, pd.DataFrame):
                 df.to_csv(csv_filepath)
                 print("Saved to filepath: {}".format(csv_filepath))
+                print("Lookup cache: {}, queries avoided: {}".format(
+                    self.helper.result_cache.stats(), self.helper.avoided_queries))
+                if self.helper.node_cache is not None:
+                    print("Node cache: {}".format(self.helper.node_cache.stats()))
+                if self.helper.disk_cache is not None:
+                    print("Disk cache: {}".format(self.helper.disk_cache.stats()))
                 res = self.basedb.update_file_metadata(
                     filename, is_processed=True, num_hands=len_segments, num_hands_processed=df.shape[0], processing_time=processing_time)
                 print("Commit to database: ", res)
@@ -1,7 +1,6 @@
 import os
 import json
 import datetime
-import pymongo
 from . import exceptions
 
 
@@ -24,9 +23,17 @@ path_to_pem_file = os.path.join(parentdir, "hidden",
 class BaseDB(object):
 
     def __init__(self) -> None:
-        self.dbconn = self.create_db()
+        self._dbconn = None
+
+    @property
+    def dbconn(self):
+        """The file_list collection, connected on first use"""
+        if self._dbconn is None:
+            self._dbconn = self.create_db()
+        return self._dbconn
 
     def create_db(self):
+        import pymongo
         conn_string = "mongodb://{}:{}@{}:{}".format(configdict.get("MONGO_USER"), configdict.get(
             "MONGO_PWD"), configdict.get("MONGO_HOST"), configdict.get("MONGO_PORT"))
         try:
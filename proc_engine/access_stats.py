@@ -0,0 +1,117 @@
+import time
+import atexit
+import logging
+import sqlite3
+import threading
+
+
+class AccessStats(object):
+    """
+    Per (dbname, node) counts of solver lookups and of the misses among
+    them (lookups no cache could answer, which went to the store). Counts are kept in
+    memory and added to a SQLite file at most every flush_seconds, so
+    several workers can share one histogram.
+    """
+
+    def __init__(self, path, flush_seconds=60):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.counts = dict()
+        self.last_flush = time.monotonic()
+        self._conn = None
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS node_access ("
+                "dbname TEXT NOT NULL, node TEXT NOT NULL, "
+                "accesses INTEGER NOT NULL, misses INTEGER NOT NULL, "
+                "PRIMARY KEY (dbname, node)) WITHOUT ROWID;")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def record(self, dbname, node, miss=False):
+        with self.lock:
+            counts = self.counts.get((dbname, node))
+            if counts is None:
+                counts = self.counts[(dbname, node)] = [0, 0]
+            counts[0] += 1
+            if miss:
+                counts[1] += 1
+            due = time.monotonic() - self.last_flush >= self.flush_seconds
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Adds the counts recorded since the last flush to the file"""
+        with self.lock:
+            counts, self.counts = self.counts, dict()
+            self.last_flush = time.monotonic()
+            if not len(counts):
+                return
+            try:
+                self.conn.executemany(
+                    "INSERT INTO node_access VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (dbname, node) DO UPDATE SET "
+                    "accesses = accesses + excluded.accesses, "
+                    "misses = misses + excluded.misses;",
+                    [(dbname, node, accesses, misses)
+                     for (dbname, node), (accesses, misses) in counts.items()])
+                self.conn.commit()
+            except Exception as e:
+                print(e)
+                logging.error("Could not save node access stats to {}".format(self.path))
+
+    def hottest(self, limit=None):
+        """(dbname, node, accesses, misses) rows, most accessed first"""
+        self.flush()
+        query = "SELECT dbname, node, accesses, misses FROM node_access ORDER BY accesses DESC"
+        with self.lock:
+            if limit is not None:
+                return self.conn.execute(query + " LIMIT ?;", (limit,)).fetchall()
+            return self.conn.execute(query + ";").fetchall()
+
+    def report(self, coverage=0.9):
+        """
+        The most accessed nodes that together account for coverage of all
+        lookups, as dicts with their share and the running total.
+        """
+        rows = self.hottest()
+        total = sum(row[2] for row in rows)
+        report = []
+        running = 0
+        for dbname, node, accesses, misses in rows:
+            if total == 0 or running >= coverage * total:
+                break
+            running += accesses
+            report.append({
+                "dbname": dbname,
+                "node": node,
+                "accesses": accesses,
+                "misses": misses,
+                "share": accesses / total,
+                "cumulative": running / total
+            })
+        return report
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+if __name__ == '__main__':
+    from . import __base__
+    stats = AccessStats(__base__.configdict.get("ACCESS_STATS_FILE"))
+    report = stats.report()
+    print("{} nodes account for 90% of lookups".format(len(report)))
+    for row in report:
+        print("{dbname}\t{node}\t{accesses}\t{misses}\t{share:.2%}\t{cumulative:.2%}".format(**row))
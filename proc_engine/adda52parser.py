@@ -1,13 +1,14 @@
 
 import datetime
 import enum
+import itertools
 import os
 import re
-import pandas as pd
 import time
 from . import __base__
 from .helper_functions import Helper
-from . import pdf_to_text
+from .scoring import result_moves, score_decisions
+from .parallel import run_chunks
 from pprint import pprint
 
 
@@ -17,6 +18,15 @@ class Adda52Parser(object):
         self.helper = kwargs.get("helper")
         self.configdict = __base__.configdict
         self.rake = kwargs.get("rake", 500)
+        # Hands of a file are spread over this many processes when above 1
+        self.processes = kwargs.get(
+            "processes", self.configdict.get("PARALLEL_PROCESSES", 1))
+        self.chunk_size = kwargs.get(
+            "chunk_size", self.configdict.get("PARALLEL_CHUNK_SIZE", 500))
+        # Workers read the moves trees and categories of self.helper from shared memory
+        self.share_data = kwargs.get(
+            "share_data", self.configdict.get("PARALLEL_SHARE_DATA", True))
+        self.helper_kwargs = kwargs.get("helper_kwargs", {})
         self.logger = kwargs.get("logger")
         self.logging_enabled = kwargs.get("logging_enabled")
 
@@ -31,8 +41,13 @@ class Adda52Parser(object):
         self.correct_terms = ["Correct", "EV Loss"]
         self.heroname = kwargs.get("heroname", None)
         self.positions = ["EP", "MP", "CO", "BU", "SB", "BB"]
+        self.report_columns = [
+            "ID", "Hand", "Pairedness", "Suitedness", "Hand Category", "Position",
+            "Result", "Opportunity", "Big Blind", "Player's Move", "GTO Move",
+            "Amount Won in Terms of BB", "Move EV", "GTO EV"]
 
     def convert_pdf_to_txt(self, pdf_filename, text_filename):
+        from . import pdf_to_text
         with open(text_filename, "w+") as f:
             f.write(pdf_to_text.convert_to_text(pdf_filename))
 
@@ -70,12 +85,18 @@ class Adda52Parser(object):
         return cards
 
     def get_file_contents(self, filepath):
+        """Lines of the file, read as they are consumed"""
         with open(filepath) as f:
-            return f.readlines()
+            for line in f:
+                yield line
 
     def get_file_segments(self, filepath):
-        file_contents = self.get_file_contents(filepath)
-        segments = []
+        """
+        Yields the hands of the file one at a time as [info_lines,
+        preflop_lines, winner_lines], setting self.heroname on the way if
+        it is None
+        """
+        file_contents = self.watch_heroname(self.get_file_contents(filepath))
         info_lines = []
         preflop_lines = []
         winner_lines = []
@@ -85,7 +106,7 @@ class Adda52Parser(object):
                 continue
             if "*****" in line:
                 if len(info_lines) and len(preflop_lines):
-                    segments.append([info_lines, preflop_lines, winner_lines])
+                    yield [info_lines, preflop_lines, winner_lines]
                     flag = 1
                     info_lines = []
                     preflop_lines = []
@@ -99,118 +120,198 @@ class Adda52Parser(object):
                 flag = 0
             if "Winner" in line:
                 winner_lines.append(line)
-        return segments
 
-    def parse_text(self, filepath):
-        if os.path.isfile(filepath):
-            self.heroname = self.get_heroname(filepath)
-            segments = self.get_file_segments(filepath)
-            len_segments = len(segments)
-            return_values = []
-            for k, segment in enumerate(segments):
-                try:
-                    info_lines, action_lines, winner_lines = segment
-                    position = None
-                    i = 0
-                    action_sequence = []
-                    position_found = False
-                    position_found_using_index = False
-                    user_lines = []
-                    amount_won = 0.
-                    for line in info_lines:
-                        if self.heroname in line:
-                            position = self.get_named_position(line)
+    def get_segment_decisions(self, segment):
+        """
+        Parses a hand up to the solver lookups. Returns one entry per hero
+        decision holding the row context and the run_everything arguments.
+        """
+        info_lines, action_lines, winner_lines = segment
+        position = None
+        i = 0
+        action_sequence = []
+        position_found = False
+        position_found_using_index = False
+        user_lines = []
+        amount_won = 0.
+        for line in info_lines:
+            if self.heroname in line:
+                position = self.get_named_position(line)
+                position_found = True
+            elif "Blinds" in line:
+                bigblind = self.get_bigblind(line)
+            elif "Hand ID" in line:
+                gameid = self.get_gameid(line)
+        if position == "SB":
+            amount_won -= bigblind/2
+        elif position == "BB":
+            amount_won -= bigblind
+
+        for line in action_lines:
+            if "My Cards" in line:
+                holecards = self.get_holecards(line)
+            else:
+                move = self.move_regex.findall(line)
+                if len(move):
+                    user_lines.append(line)
+                    if self.heroname in line:
+                        amount = re.findall(r'\d+', line)
+                        if len(amount):
+                            if "raise" in move[0].lower() or "call" in move[0].lower():
+                                amount_won = -float(amount[0])
+
+                            elif "return" in move[0].lower():
+                                amount_won += float(amount[0])
+
+                        action_sequence.append(
+                            " ".join(["hero", move[0]]))
+                        if not position_found:
                             position_found = True
-                        elif "Blinds" in line:
-                            bigblind = self.get_bigblind(line)
-                        elif "Hand ID" in line:
-                            gameid = self.get_gameid(line)
-                    if position == "SB":
-                        amount_won -= bigblind/2
-                    elif position == "BB":
-                        amount_won -= bigblind
+                            position_found_using_index = True
+                            position_index = i
+                    else:
+                        action_sequence.append(move[0])
+                    i += 1
+        unique_players = self.get_unique_users(user_lines)
+        if position_found_using_index:
+            position = self.positions[position_index -
+                                      len(unique_players) + 6]
+        action_sequences = self.process_action_sequence(
+            action_sequence)
+        for line in winner_lines:
+            if self.heroname in line:
+                amount = re.findall(r'\d+', line)
+                if len(amount):
+                    amount_won = float(amount[0])
+        category = self.helper.get_category(holecards)
+        if category is None:
+            category = {}
+        decisions = []
+        for action_seq in action_sequences:
+            opportunity = self.get_strategy_from_moves(action_seq)
+            current_action = self.moves_regex.findall(
+                action_seq[-1])
+            action_seq[-1] = "hero"
+            decisions.append({
+                "lookup": (holecards, " ".join(action_seq), 100, self.rake, len(unique_players)),
+                "current_action": current_action,
+                "gameid": gameid,
+                "holecards": holecards,
+                "category": category,
+                "position": position,
+                "opportunity": opportunity,
+                "bigblind": bigblind,
+                "amount_won": amount_won
+            })
+        return decisions
 
-                    for line in action_lines:
-                        if "My Cards" in line:
-                            holecards = self.get_holecards(line)
-                        else:
-                            move = self.move_regex.findall(line)
-                            if len(move):
-                                user_lines.append(line)
-                                if self.heroname in line:
-                                    amount = re.findall(r'\d+', line)
-                                    if len(amount):
-                                        if "raise" in move[0].lower() or "call" in move[0].lower():
-                                            amount_won = -float(amount[0])
+    def extract_decision(self, decision, res_dict):
+        """
+        Report fields of a decision and the (move, ev) pairs of its solver
+        lookup, for score_decisions. None if the lookup found no node.
+        """
+        if res_dict is None:
+            return None
+        moves = result_moves(res_dict)
+        category = decision["category"]
+        players_move = decision["current_action"][0]
+        if not decision["bigblind"]:
+            raise ZeroDivisionError("division by zero")
+        return {
+            "ID": decision["gameid"],
+            "Hand": decision["holecards"],
+            "Pairedness": category.get("pairing", ""),
+            "Suitedness": category.get("suiting", ""),
+            "Hand Category": category.get("category", ""),
+            "Position": decision["position"],
+            "Opportunity": decision["opportunity"],
+            "Player's Move": players_move,
+            "bigblind": decision["bigblind"],
+            "amount_won": decision["amount_won"]
+        }, moves
 
-                                        elif "return" in move[0].lower():
-                                            amount_won += float(amount[0])
+    def extract_segment(self, decisions, results):
+        """Extracts all decisions of a hand, raising the first lookup error"""
+        extracted = []
+        for decision, res_dict in zip(decisions, results):
+            if isinstance(res_dict, Exception):
+                raise res_dict
+            row = self.extract_decision(decision, res_dict)
+            if row is not None:
+                extracted.append(row)
+        return extracted
 
-                                    action_sequence.append(
-                                        " ".join(["hero", move[0]]))
-                                    if not position_found:
-                                        position_found = True
-                                        position_found_using_index = True
-                                        position_index = i
-                                else:
-                                    action_sequence.append(move[0])
-                                i += 1
-                    unique_players = self.get_unique_users(user_lines)
-                    if position_found_using_index:
-                        position = self.positions[position_index -
-                                                  len(unique_players) + 6]
-                    action_sequences = self.process_action_sequence(
-                        action_sequence)
-                    for line in winner_lines:
-                        if self.heroname in line:
-                            amount = re.findall(r'\d+', line)
-                            if len(amount):
-                                amount_won = float(amount[0])
-                    category = self.helper.get_category(holecards)
-                    if category is None:
-                        category = {}
-                    for action_seq in action_sequences:
-                        opportunity = self.get_strategy_from_moves(action_seq)
-                        current_action = self.moves_regex.findall(
-                            action_seq[-1])
-                        action_seq[-1] = "hero"
-                        res_dict = self.helper.run_everything(holecards, " ".join(
-                            action_seq), 100, self.rake, len(unique_players))
-                        if res_dict is None:
-                            continue
-                        best_action = None
-                        highest_ev = max([res_dict[key]["ev"]
-                                         for key in res_dict])
-                        for key, val in res_dict.items():
-                            if highest_ev - val["ev"] < 0.0001:
-                                best_action = key
-                        if current_action[0] == best_action:
-                            correct = self.correct_terms[0]
-                        else:
-                            correct = self.correct_terms[1]
-                        move_ev = res_dict.get(
-                            current_action[0], {}).get("ev", None)
-                        if move_ev is not None:
-                            move_ev = move_ev/2000
-                        return_values.append({
-                            "ID": gameid,
-                            "Hand": holecards,
-                            "Pairedness": category.get("pairing", ""),
-                            "Suitedness": category.get("suiting", ""),
-                            "Hand Category": category.get("category", ""),
-                            "Position": position,
-                            "Result": correct,
-                            "Opportunity": opportunity,
-                            "Big Blind": "{}/{}".format(int(bigblind/2), int(bigblind)),
-                            "Player's Move": current_action[0],
-                            "GTO Move": best_action,
-                            "Amount Won in Terms of BB": amount_won/bigblind,
-                            "Move EV": move_ev,
-                            "GTO EV": highest_ev
-                        })
-                except Exception as e:
-                    print("Error in section: {}: {}".format(k, e))
-            return return_values, len_segments
+    def score_extracted(self, extracted):
+        """Scores extracted decisions into the report DataFrame"""
+        return score_decisions(
+            [row for row, moves in extracted], [moves for row, moves in extracted],
+            self.correct_terms, self.report_columns)
+
+    def get_dbnames(self, segments):
+        """dbnames the lookups of segments go to, hands that fail to parse are left out"""
+        dbnames = set()
+        for segment in segments:
+            try:
+                decisions = self.get_segment_decisions(segment)
+            except Exception:
+                continue
+            for decision in decisions:
+                dbnames.add(self.helper.get_dbname(*decision["lookup"][2:]))
+        return sorted(dbnames)
+
+    def process_chunk(self, chunk):
+        """
+        Runs the hands of chunk, a list of (index, segment), up to scoring
+        with one run_many for all of their lookups. Returns the (index,
+        extracted decisions) of every hand, the error message instead of
+        the decisions for a hand that failed.
+        """
+        outcomes = {}
+        parsed_segments = []
+        for k, segment in chunk:
+            try:
+                parsed_segments.append(
+                    (k, self.get_segment_decisions(segment)))
+            except Exception as e:
+                outcomes[k] = "Error in section: {}: {}".format(k, e)
+        try:
+            results = self.helper.run_many(
+                [decision["lookup"] for k, decisions in parsed_segments for decision in decisions])
+        except Exception as e:
+            for k, decisions in parsed_segments:
+                outcomes[k] = "Error in section: {}: {}".format(k, e)
+            return [(k, outcomes[k]) for k, segment in chunk]
+        position = 0
+        for k, decisions in parsed_segments:
+            segment_results = results[position:position + len(decisions)]
+            position += len(decisions)
+            try:
+                outcomes[k] = self.extract_segment(decisions, segment_results)
+            except Exception as e:
+                outcomes[k] = "Error in section: {}: {}".format(k, e)
+        return [(k, outcomes[k]) for k, segment in chunk]
+
+    def parse_text(self, filepath):
+        if os.path.isfile(filepath):
+            self.heroname = None
+            segments = self.get_file_segments(filepath)
+            # Hands read before the hero is known are held back until it is
+            buffered = []
+            for segment in segments:
+                buffered.append(segment)
+                if self.heroname is not None:
+                    break
+            len_segments = 0
+            return_values = []
+            for k, outcome in run_chunks(
+                    self, itertools.chain(buffered, segments),
+                    parser_kwargs={"rake": self.rake, "heroname": self.heroname}):
+                len_segments += 1
+                if isinstance(outcome, str):
+                    print(outcome)
+                else:
+                    return_values.extend(outcome)
+            return self.score_extracted(return_values), len_segments
 
     def get_strategy_from_moves(self, action_sequence):
         fold = 0
@@ -240,16 +341,22 @@ class Adda52Parser(object):
         else:
             return "Other"
 
-    def get_heroname(self, filepath):
-        file_contents = self.get_file_contents(filepath)
-        for line in file_contents:
-            if "My Cards" in line:
-                current_cards = set(self.get_holecards(line))
-            if "Winner" in line:
-                winner_cards = set(self.get_holecards(line))
-                if len(winner_cards):
-                    if len(current_cards.intersection(set(winner_cards))):
-                        return re.findall(r'\w+', line)[2]
+    def watch_heroname(self, lines):
+        """
+        Passes lines through, setting self.heroname from the first winner
+        line showing cards of the hero while it is None
+        """
+        current_cards = set()
+        for line in lines:
+            if self.heroname is None:
+                if "My Cards" in line:
+                    current_cards = set(self.get_holecards(line))
+                if "Winner" in line:
+                    winner_cards = set(self.get_holecards(line))
+                    if len(winner_cards):
+                        if len(current_cards.intersection(set(winner_cards))):
+                            self.heroname = re.findall(r'\w+', line)[2]
+            yield line
 
     def process_action_sequence(self, action_sequence: list) -> list:
         int_action_sequence = []
@@ -290,11 +397,10 @@ class Adda52Parser(object):
 
     def run_everything(self, filepath):
         start_time = time.time()
-        return_values, len_segments = self.parse_text(filepath)
+        df, len_segments = self.parse_text(filepath)
         end_time = time.time()
         print("Time taken: {:.2f}min".format((end_time - start_time)/60))
-        if return_values is not None:
-            df = pd.DataFrame(return_values)
+        if df is not None:
             return df, len_segments
         else:
             return None, 0
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+import threading
+from .prepared_statements import quote_table
+from .stores import PostgresMongoStore, ConsolidatedPostgresStore, ROWS_TABLE
+
+
+class AsyncLookupEngine(object):
+    """
+    Runs the fetches of a Helper batch on an asyncio event loop of its own,
+    at most max_concurrency of them in flight at once.
+
+    Against Postgres the solver tables are read with asyncpg, one pool per
+    dbname opened on first use, so a batch waits on the database without
+    holding a thread per query. asyncpg prepares and caches the statements
+    itself. Fetches it cannot make (best actions, the node cache, other
+    stores) go to the helper's thread pool as before.
+    The loop runs in a daemon thread, so synchronous callers can use
+    fetch_many and coroutines running on another loop fetch_many_async.
+    """
+
+    def __init__(self, helper, max_concurrency=32):
+        self.helper = helper
+        self.max_concurrency = max_concurrency
+        self.pools = dict()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.semaphore = self.run(self._make_semaphore())
+
+    async def _make_semaphore(self):
+        # Created on the engine's loop, which older Pythons bind it to
+        return asyncio.Semaphore(self.max_concurrency)
+
+    def run(self, coro):
+        """Runs coro on the engine's loop and waits for its result"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def fetch_many(self, fetches):
+        """Runs the fetches of a planned batch, results in the same order"""
+        return self.run(self._fetch_all(fetches))
+
+    async def fetch_many_async(self, fetches):
+        """fetch_many awaitable from any event loop"""
+        return await asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(self._fetch_all(fetches), self.loop))
+
+    async def _fetch_all(self, fetches):
+        return await asyncio.gather(*[self._fetch(fetch) for fetch in fetches])
+
+    @property
+    def uses_asyncpg(self):
+        helper = self.helper
+        return (isinstance(helper.store, PostgresMongoStore)
+                and not helper.use_best_actions and helper.node_cache is None)
+
+    async def _fetch(self, fetch):
+        async with self.semaphore:
+            if not self.uses_asyncpg:
+                return await self.loop.run_in_executor(
+                    self.helper.executor, self.helper.fetch_planned, fetch)
+            try:
+                if isinstance(self.helper.store, ConsolidatedPostgresStore):
+                    return await self.fetch_tables_rows(*fetch)
+                return await self.fetch_table_rows(*fetch)
+            except Exception as e:
+                return e
+
+    async def get_pool(self, dbname):
+        """Returns the asyncpg pool of dbname, creating it on first use"""
+        pool = self.pools.get(dbname)
+        if pool is None:
+            import asyncpg
+            store = self.helper.store
+            try:
+                pool = await asyncpg.create_pool(
+                    "postgresql://{}:{}@{}:{}/{}".format(
+                        store.configdict.get("PG_USER"),
+                        store.configdict.get("PG_PWD"),
+                        store.configdict.get("PG_HOST"),
+                        store.configdict.get("PG_PORT"),
+                        dbname),
+                    min_size=0, max_size=store.pool_size,
+                    statement_cache_size=store.max_prepared_statements)
+            except Exception as e:
+                print(e)
+                logging.error("Could not connect to database {}".format(dbname))
+                raise
+            # Another fetch may have opened one while this one connected
+            if dbname in self.pools:
+                await pool.close()
+            else:
+                self.pools[dbname] = pool
+            pool = self.pools[dbname]
+        return pool
+
+    async def _in_catalog(self, dbname, tables):
+        """The tables that exist, counting the others as avoided queries"""
+        catalog = await self.loop.run_in_executor(
+            self.helper.executor, self.helper.get_table_catalog, dbname)
+        present = [table for table in tables if table in catalog]
+        if len(present) < len(tables):
+            with self.helper.lock:
+                self.helper.avoided_queries += len(tables) - len(present)
+        return present
+
+    async def fetch_table_rows(self, key, combos, tables=None):
+        """Async Helper.fetch_table_rows, key is (dbname, table)"""
+        dbname, table = key
+        if not len(await self._in_catalog(dbname, [table])):
+            return {}
+        pool = await self.get_pool(dbname)
+        result = await pool.fetch(
+            "SELECT combo, * FROM {} WHERE combo = ANY($1::text[])".format(
+                quote_table(table)), list(combos))
+        rows = {}
+        for res in result:
+            if res[0] not in rows:
+                rows[res[0]] = (res[2], res[3])
+        return rows
+
+    async def fetch_tables_rows(self, key, combos, tables):
+        """Async Helper.fetch_tables_rows for a consolidated database, key is (dbname, node)"""
+        dbname = key[0]
+        table_rows = {table: {} for table in tables}
+        present = await self._in_catalog(dbname, tables)
+        if not len(present):
+            return table_rows
+        node_ids = await self.loop.run_in_executor(
+            self.helper.executor, self.helper.store.get_node_ids, dbname)
+        names = {node_ids[table]: table for table in present}
+        pool = await self.get_pool(dbname)
+        result = await pool.fetch(
+            "SELECT node_id, combo, weight, ev FROM {} "
+            "WHERE node_id = ANY($1::integer[]) AND combo = ANY($2::text[])".format(ROWS_TABLE),
+            list(names), list(combos))
+        for node_id, combo, weight, ev in result:
+            table_rows[names[node_id]][combo] = (weight, ev)
+        return table_rows
+
+    async def _close_pools(self):
+        pools, self.pools = self.pools, dict()
+        for pool in pools.values():
+            await pool.close()
+
+    def close(self):
+        """Closes the pools and stops the loop"""
+        self.run(self._close_pools())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,121 @@
+import logging
+from .scoring import EV_TOLERANCE
+
+BEST_ACTION_TABLE = "best_actions"
+# Where a rebuild writes before it replaces BEST_ACTION_TABLE
+BEST_ACTION_STAGING_TABLE = "best_actions_staging"
+BATCH_SIZE = 10000
+
+
+def create_best_action_table(cursor, table=BEST_ACTION_TABLE):
+    """(Re)creates an empty best action table"""
+    cursor.execute("DROP TABLE IF EXISTS {};".format(table))
+    cursor.execute(
+        "CREATE TABLE {} ("
+        "node text NOT NULL, "
+        "combo text NOT NULL, "
+        "moves text[] NOT NULL, "
+        "weights double precision[] NOT NULL, "
+        "evs double precision[] NOT NULL, "
+        "best_action text NOT NULL, "
+        "best_ev double precision NOT NULL, "
+        "PRIMARY KEY (node, combo));".format(table))
+
+
+def best_action(res_dict):
+    """The GTO move of a strategy and its EV: the last move within EV_TOLERANCE of the highest EV, as the scoring picks it"""
+    move = None
+    highest_ev = max(val["ev"] for val in res_dict.values())
+    for key, val in res_dict.items():
+        if highest_ev - val["ev"] < EV_TOLERANCE:
+            move = key
+    return move, highest_ev
+
+
+def read_table_rows(helper, dbname, table):
+    """Every row of a solver table through the helper's store, first row per combo wins"""
+    rows = {}
+    for combo, weight, ev in helper.store.iter_table_rows(dbname, table):
+        if combo not in rows:
+            rows[combo] = (weight, ev)
+    return rows
+
+
+def build_node_rows(helper, node, next_tables, table_rows):
+    """
+    Materialises one node: for every combo found in at least one child
+    table, the strategy exactly as Helper.build_strategy returns it and
+    its best action. A combo build_strategy raises on is left out and logged, lookups of it
+    get "Could not find cards".
+    """
+    combos = set()
+    for rows in table_rows.values():
+        combos.update(rows)
+    for combo in sorted(combos):
+        try:
+            res_dict = helper.build_strategy(combo, next_tables, table_rows)
+        except Exception as e:
+            logging.error("Could not build {} at {}: {}".format(combo, node, e))
+            continue
+        yield (node, combo,
+               list(res_dict),
+               [val["weight"] for val in res_dict.values()],
+               [val["ev"] for val in res_dict.values()],
+               *best_action(res_dict))
+
+
+def build_best_action_table(helper, dbname, conn, nodes=None):
+    """
+    Rebuilds the best action table of dbname from its solver tables, one
+    row per (node, combo). nodes limits the build to some node names.
+    The rows go into a staging table that replaces the live one when the
+    transaction commits, lookups see the old table until then.
+    Returns the number of rows written.
+    """
+    from psycopg2.extras import execute_values
+    catalog = helper.get_table_catalog(dbname)
+    tree = helper.get_moves_tree(dbname)
+    count = 0
+    conn.autocommit = False
+    with conn, conn.cursor() as cursor:
+        create_best_action_table(cursor, BEST_ACTION_STAGING_TABLE)
+        for path, next_moves in tree.lookup_nodes():
+            next_tables = helper.get_table_names_from_db(path, next_moves)
+            node = helper.get_node_name(next_tables)
+            if node is None or (nodes is not None and node not in nodes):
+                continue
+            table_rows = {table: read_table_rows(helper, dbname, table) if table in catalog else {}
+                          for table in next_tables.values()}
+            batch = []
+            for row in build_node_rows(helper, node, next_tables, table_rows):
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    execute_values(cursor, "INSERT INTO {} VALUES %s".format(
+                        BEST_ACTION_STAGING_TABLE), batch)
+                    count += len(batch)
+                    batch = []
+            if len(batch):
+                execute_values(cursor, "INSERT INTO {} VALUES %s".format(
+                    BEST_ACTION_STAGING_TABLE), batch)
+                count += len(batch)
+        cursor.execute("ANALYZE {};".format(BEST_ACTION_STAGING_TABLE))
+        swap_best_action_table(cursor)
+    return count
+
+
+def swap_best_action_table(cursor):
+    """Replaces the best action table with the staging table, index name included for the next rebuild"""
+    cursor.execute("DROP TABLE IF EXISTS {};".format(BEST_ACTION_TABLE))
+    cursor.execute("ALTER TABLE {} RENAME TO {};".format(
+        BEST_ACTION_STAGING_TABLE, BEST_ACTION_TABLE))
+    cursor.execute("ALTER INDEX {}_pkey RENAME TO {}_pkey;".format(
+        BEST_ACTION_STAGING_TABLE, BEST_ACTION_TABLE))
+
+
+if __name__ == '__main__':
+    from .helper_functions import Helper
+    helper = Helper(store="postgres", use_pack=False, use_best_actions=False)
+    for dbname in helper.dbs:
+        with helper.connection(dbname) as conn:
+            count = build_best_action_table(helper, dbname, conn)
+        print("Wrote {} best actions of {}".format(count, dbname))
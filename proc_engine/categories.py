@@ -0,0 +1,110 @@
+import os
+import json
+import struct
+from array import array
+from . import combos
+
+
+MAGIC = b"GTOCATS\0"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+FIELDS = ("pairing", "suiting", "category")
+MISSING = 0
+
+
+class CategoryTable(object):
+    """
+    The static ranges.card_ranges collection held in memory.
+
+    One byte array per field, indexed by combo id. Each byte is a code into
+    the shared self.strings dictionary; code 0 marks a combo with no entry.
+    """
+
+    def __init__(self):
+        self.strings = [None]
+        self.string_codes = {}
+        self.columns = {field: array('B', bytes(combos.NUM_COMBOS))
+                        for field in FIELDS}
+
+    def __len__(self):
+        return sum(1 for code in self.columns[FIELDS[0]] if code != MISSING)
+
+    def _string_code(self, value):
+        code = self.string_codes.get(value)
+        if code is None:
+            code = len(self.strings)
+            if code > 255:
+                raise ValueError("Too many distinct category strings")
+            self.strings.append(value)
+            self.string_codes[value] = code
+        return code
+
+    def add(self, document):
+        """Adds one card_ranges document"""
+        return self._add(combos.canonical_combo_id(document.get("cards")), document)
+
+    def _add(self, _id, document):
+        if _id < 0:
+            return False
+        for field in FIELDS:
+            self.columns[field][_id] = self._string_code(document.get(field))
+        return True
+
+    def lookup(self, _id):
+        """Returns the card_ranges fields of a combo id, or None"""
+        if _id < 0 or self.columns[FIELDS[0]][_id] == MISSING:
+            return None
+        ret_dict = {"cards": combos.combo_from_id(_id)}
+        for field in FIELDS:
+            value = self.strings[self.columns[field][_id]]
+            if value is not None:
+                ret_dict[field] = value
+        return ret_dict
+
+    def get(self, cards):
+        """Same result as card_ranges.find_one({"cards": cards}), without the _id"""
+        return self.lookup(combos.canonical_combo_id(cards))
+
+    @classmethod
+    def from_collection(cls, collection):
+        table = cls()
+        documents = list(collection.find({}, projection={"_id": False}))
+        ids = combos.encode_many([document.get("cards") for document in documents],
+                                 canonical=True).tolist()
+        for _id, document in zip(ids, documents):
+            table._add(_id, document)
+        return table
+
+    def save(self, path):
+        strings = json.dumps(self.strings[1:]).encode()
+        tmp_path = "{}.tmp".format(path)
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(strings)))
+            f.write(strings)
+            for field in FIELDS:
+                self.columns[field].tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        table = cls()
+        with open(path, "rb") as f:
+            magic, version, strings_len = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("Not a category table: {}".format(path))
+            for value in json.loads(f.read(strings_len).decode()):
+                table._string_code(value)
+            for field in FIELDS:
+                column = array('B')
+                column.fromfile(f, combos.NUM_COMBOS)
+                table.columns[field] = column
+        return table
+
+
+if __name__ == '__main__':
+    from .helper_functions import Helper
+    helper = Helper(category_file=None)
+    path = helper.configdict.get("CATEGORY_FILE")
+    table = helper.category_table
+    table.save(path)
+    print("Saved {} hands to {}".format(len(table), path))
@@ -0,0 +1,153 @@
+import math
+
+
+# Cards in the order used by Helper.alpha_ranks, so that ascending card
+# indices spell the alphabetical combo strings stored in the solver tables.
+CARDS = [
+    "{}{}".format(rank, suite) for rank in "AKQJT98765432" for suite in "cdhs"
+]
+NUM_CARDS = len(CARDS)
+HAND_SIZE = 4
+
+CARD_POSITION = {card: i for i, card in enumerate(CARDS)}
+CARD_INDEX = dict()
+for _i, _card in enumerate(CARDS):
+    for _rank in {_card[0], _card[0].lower()}:
+        for _suite in {_card[1], _card[1].upper()}:
+            CARD_INDEX[_rank + _suite] = _i
+
+
+BINOMIAL = [[math.comb(n, k) for k in range(HAND_SIZE + 1)]
+            for n in range(NUM_CARDS + 1)]
+NUM_COMBOS = BINOMIAL[NUM_CARDS][HAND_SIZE]  # 270725
+
+_encoder_tables = {}
+
+
+def get_encoder_tables(canonical=False):
+    """
+    numpy lookup tables of the batch encoder, built on first use so that
+    importing this module does not import numpy.
+    Returns (binomial_columns, rank_codes, suite_codes) where
+    binomial_columns[j][c] = C(c, j+1) is the weight of the j-th smallest card.
+    With canonical only the letter case of CARDS is decoded.
+    """
+    tables = _encoder_tables.get(canonical)
+    if tables is None:
+        import numpy as np
+        binomial_columns = np.array(
+            [[BINOMIAL[c][j + 1] for c in range(NUM_CARDS)] for j in range(HAND_SIZE)],
+            dtype=np.int32)
+        rank_codes = np.full(256, -1, dtype=np.int32)
+        suite_codes = np.full(256, -1, dtype=np.int32)
+        for i, rank in enumerate("AKQJT98765432"):
+            rank_codes[ord(rank)] = i
+            if not canonical:
+                rank_codes[ord(rank.lower())] = i
+        for i, suite in enumerate("cdhs"):
+            suite_codes[ord(suite)] = i
+            if not canonical:
+                suite_codes[ord(suite.upper())] = i
+        tables = _encoder_tables[canonical] = binomial_columns, rank_codes, suite_codes
+    return tables
+
+
+def split_cards(cards):
+    """Splits a 2n length string of cards into a list, lists are returned as is"""
+    if isinstance(cards, str):
+        return [cards[i:i+2] for i in range(0, len(cards), 2)]
+    return cards
+
+
+def card_indices(cards):
+    return [CARD_INDEX[card] for card in split_cards(cards)]
+
+
+def indices_to_id(indices):
+    """Combinatorial number system rank of an ascending list of card indices"""
+    return sum(BINOMIAL[c][j + 1] for j, c in enumerate(indices))
+
+
+def combo_id(cards):
+    """Maps a 4 card hand, in any order, to an integer in [0, 270725)"""
+    indices = sorted(card_indices(cards))
+    if len(indices) != HAND_SIZE or len(set(indices)) != HAND_SIZE:
+        raise ValueError("Not a 4 card hand: {}".format(cards))
+    return indices_to_id(indices)
+
+
+def canonical_combo_id(combo):
+    """
+    combo_id for a combo string that is already in alphabetical order,
+    -1 for anything else. Mirrors an exact string match on the combo column.
+    """
+    if not isinstance(combo, str) or len(combo) != 2 * HAND_SIZE:
+        return -1
+    indices = []
+    for i in range(0, len(combo), 2):
+        index = CARD_POSITION.get(combo[i:i+2])
+        if index is None:
+            return -1
+        indices.append(index)
+    for a, b in zip(indices, indices[1:]):
+        if a >= b:
+            return -1
+    return indices_to_id(indices)
+
+
+def combo_from_id(_id):
+    """Inverse of combo_id, returns the alphabetical combo string"""
+    if not 0 <= _id < NUM_COMBOS:
+        raise ValueError("Combo id out of range: {}".format(_id))
+    cards = []
+    for j in range(HAND_SIZE, 0, -1):
+        c = j - 1
+        while BINOMIAL[c + 1][j] <= _id:
+            c += 1
+        _id -= BINOMIAL[c][j]
+        cards.append(CARDS[c])
+    return "".join(reversed(cards))
+
+
+def encode_many(hands, canonical=False):
+    """
+    Batch combo_id. hands is a sequence of card strings (as
+    PokerStarsParser.get_cards gives them) or card lists (as
+    Adda52Parser.get_holecards does), returns an int32 array with -1
+    for entries that are not 4 card hands.
+    With canonical, batch canonical_combo_id: -1 as well for anything
+    but a combo string already in alphabetical order.
+    """
+    import numpy as np
+    binomial_columns, rank_codes, suite_codes = get_encoder_tables(canonical)
+    width = 2 * HAND_SIZE
+    strings = []
+    for hand in hands:
+        if hand is not None and not isinstance(hand, str):
+            hand = None if canonical else "".join(hand)
+        if hand is None or len(hand) != width:
+            hand = "?" * width
+        strings.append(hand)
+    if not len(strings):
+        return np.zeros(0, dtype=np.int32)
+    buf = np.frombuffer("".join(strings).encode("ascii", "replace"),
+                        dtype=np.uint8).reshape(len(strings), width)
+    ranks = rank_codes[buf[:, 0::2]]
+    suites = suite_codes[buf[:, 1::2]]
+    valid = np.all((ranks >= 0) & (suites >= 0), axis=1)
+    indices = np.where(valid[:, None], ranks * 4 + suites, 0)
+    if canonical:
+        valid &= np.all(indices[:, 1:] > indices[:, :-1], axis=1)
+    else:
+        indices.sort(axis=1)
+        valid &= np.all(indices[:, 1:] != indices[:, :-1], axis=1)
+    ids = np.zeros(len(strings), dtype=np.int32)
+    for j in range(HAND_SIZE):
+        ids += binomial_columns[j][indices[:, j]]
+    ids[~valid] = -1
+    return ids
+
+
+def decode_many(ids):
+    """Batch combo_from_id, returns a list of combo strings"""
+    return [combo_from_id(int(_id)) for _id in ids]
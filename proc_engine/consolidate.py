@@ -0,0 +1,76 @@
+from .prepared_statements import quote_table
+from .best_actions import BEST_ACTION_TABLE, BEST_ACTION_STAGING_TABLE
+
+
+NODES_TABLE = "solver_nodes"
+ROWS_TABLE = "strategy_rows"
+# Tables of a solver database that are not solver tables
+NON_SOLVER_TABLES = (NODES_TABLE, ROWS_TABLE, BEST_ACTION_TABLE, BEST_ACTION_STAGING_TABLE)
+
+
+def solver_table_names(cursor):
+    """Names of the per path solver tables of the database of cursor, sorted"""
+    cursor.execute(
+        "SELECT table_name FROM information_schema.tables "
+        "WHERE table_schema = 'public' ORDER BY table_name;")
+    return [res[0] for res in cursor.fetchall() if res[0] not in NON_SOLVER_TABLES]
+
+
+def consolidate(conn, drop_tables=False):
+    """
+    Migrates one solver database to the consolidated schema: every solver
+    table becomes a node in solver_nodes, and all of their rows move
+    into strategy_rows, clustered on (node_id, combo).
+    The per path tables are dropped only with drop_tables.
+    Runs in one transaction. Returns the number of tables migrated.
+    """
+    conn.autocommit = False
+    with conn, conn.cursor() as cursor:
+        tables = solver_table_names(cursor)
+        cursor.execute("DROP TABLE IF EXISTS {}, {};".format(ROWS_TABLE, NODES_TABLE))
+        cursor.execute(
+            "CREATE TABLE {} (node_id serial PRIMARY KEY, name text UNIQUE NOT NULL);".format(
+                NODES_TABLE))
+        # The key is added after the load, which is much faster than
+        # maintaining it row by row
+        cursor.execute(
+            "CREATE TABLE {} (node_id integer NOT NULL, combo text NOT NULL, "
+            "weight double precision NOT NULL, ev double precision NOT NULL);".format(
+                ROWS_TABLE))
+        for table in tables:
+            # Solver tables are (combo, weight, ev, ...), read by position
+            # like Helper always has
+            cursor.execute(
+                "SELECT column_name FROM information_schema.columns "
+                "WHERE table_schema = 'public' AND table_name = %s "
+                "ORDER BY ordinal_position;", (table,))
+            columns = [quote_table(res[0]) for res in cursor.fetchall()]
+            cursor.execute(
+                "INSERT INTO {} (name) VALUES (%s) RETURNING node_id;".format(NODES_TABLE),
+                (table,))
+            node_id = cursor.fetchall()[0][0]
+            # Of duplicate combos keep the first row in storage order, the
+            # one a scan of the table returns first as Helper reads it
+            cursor.execute(
+                "INSERT INTO {} SELECT DISTINCT ON ({}) %s, {}, {}, {} FROM {} "
+                "ORDER BY {}, ctid;".format(
+                    ROWS_TABLE, columns[0], columns[0], columns[1], columns[2],
+                    quote_table(table), columns[0]), (node_id,))
+        cursor.execute("ALTER TABLE {} ADD PRIMARY KEY (node_id, combo);".format(ROWS_TABLE))
+        cursor.execute("CLUSTER {} USING {}_pkey;".format(ROWS_TABLE, ROWS_TABLE))
+        cursor.execute("ANALYZE {}, {};".format(ROWS_TABLE, NODES_TABLE))
+        if drop_tables:
+            for table in tables:
+                cursor.execute("DROP TABLE {};".format(quote_table(table)))
+    return len(tables)
+
+
+if __name__ == '__main__':
+    import sys
+    from .helper_functions import Helper
+    helper = Helper(store="postgres", use_pack=False)
+    drop_tables = "--drop-tables" in sys.argv[1:]
+    for dbname in helper.dbs:
+        with helper.connection(dbname) as conn:
+            num_tables = consolidate(conn, drop_tables=drop_tables)
+        print("Consolidated {} tables of {}".format(num_tables, dbname))
@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import threading
+
+
+class DiskCache(object):
+    """
+    Solver lookups persisted in SQLite, keyed by (dbname, node, combo), so
+    that a restarted worker does not start cold. Every dbname carries a
+    solver version stamp: rows of a dbname are dropped when its stamp changes.
+    The connection is opened on first use. Safe to share between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self.versions = dict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            # Several workers may share the file
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS versions ("
+                "dbname TEXT PRIMARY KEY, version TEXT NOT NULL);")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "dbname TEXT NOT NULL, node TEXT NOT NULL, combo TEXT NOT NULL, "
+                "result TEXT NOT NULL, PRIMARY KEY (dbname, node, combo)) WITHOUT ROWID;")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def check_version(self, dbname, version):
+        """Drops the rows of dbname if they were written for another solver version"""
+        with self.lock:
+            if self.versions.get(dbname) == version:
+                return
+            conn = self.conn
+            res = conn.execute(
+                "SELECT version FROM versions WHERE dbname = ?;", (dbname,)).fetchone()
+            if res is None or res[0] != version:
+                conn.execute("DELETE FROM results WHERE dbname = ?;", (dbname,))
+                conn.execute("INSERT OR REPLACE INTO versions VALUES (?, ?);",
+                             (dbname, version))
+                conn.commit()
+            self.versions[dbname] = version
+
+    def get(self, dbname, node, combo):
+        """Cached result of combo at node, or None"""
+        with self.lock:
+            res = self.conn.execute(
+                "SELECT result FROM results WHERE dbname = ? AND node = ? AND combo = ?;",
+                (dbname, node, combo)).fetchone()
+            if res is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(res[0])
+
+    def put_many(self, dbname, rows):
+        """Stores (node, combo, result) rows of dbname"""
+        rows = [(dbname, node, combo, json.dumps(result))
+                for node, combo, result in rows]
+        if not len(rows):
+            return
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?);", rows)
+            self.conn.commit()
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM results;")
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.
+            }
+
+    def close(self):
+        with self.lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
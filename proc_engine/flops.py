@@ -0,0 +1,99 @@
+import itertools
+from array import array
+from . import combos
+
+
+FLOP_SIZE = 3
+NUM_FLOPS = combos.BINOMIAL[combos.NUM_CARDS][FLOP_SIZE]  # 22100
+
+# Anti alphabetical card order, as in Helper.anti_alpha_ranks
+ANTI_ALPHA_INDEX = {card: i for i, card in enumerate(
+    "{}{}".format(rank, suite) for rank in "AKQJT98765432" for suite in "shdc")}
+
+
+def flop_id(cards):
+    """Combinatorial index in [0, 22100) of three cards, in any order"""
+    return combos.indices_to_id(sorted(combos.card_indices(cards)))
+
+
+def flop_key(flop):
+    """
+    Ranks by position plus the suit pattern by position ("KsKh2c" -> ("KK2", "abc")).
+    Two flops share a key exactly when a suit permutation maps one onto
+    the other card by card, which is what Helper.find_flop_changes checks.
+    """
+    cards = combos.split_cards(flop)
+    letters = {}
+    pattern = []
+    for card in cards:
+        pattern.append(letters.setdefault(card[1], "abcd"[len(letters)]))
+    return "".join(card[0] for card in cards), "".join(pattern)
+
+
+class FlopTable(object):
+    """
+    Precomputed canonicalisation of all 22,100 flops, indexed by flop_id:
+    the anti alphabetically sorted flop and its class (flops that are suit
+    isomorphic card by card). Hole cards are not remapped with the table:
+    Helper.remap_cards keeps the suit map find_flop_changes picks, which
+    also fixes the suits absent from the flop.
+    """
+
+    def __init__(self):
+        self.sorted_flops = [None] * NUM_FLOPS
+        self.class_ids = array('i', [0]) * NUM_FLOPS
+        self.key_to_class = {}
+        for cards in itertools.combinations(combos.CARDS, FLOP_SIZE):
+            _id = flop_id(cards)
+            flop = "".join(sorted(cards, key=ANTI_ALPHA_INDEX.__getitem__))
+            key = flop_key(flop)
+            class_id = self.key_to_class.get(key)
+            if class_id is None:
+                class_id = self.key_to_class[key] = len(self.key_to_class)
+            self.sorted_flops[_id] = flop
+            self.class_ids[_id] = class_id
+
+    def class_of(self, flop):
+        """Class id of a flop exactly as written (e.g. a flop stored in the moves tree), -1 if none"""
+        if not isinstance(flop, str) or len(flop) != 2 * FLOP_SIZE:
+            return -1
+        for card in combos.split_cards(flop):
+            if card not in combos.CARD_POSITION:
+                return -1
+        return self.key_to_class.get(flop_key(flop), -1)
+
+
+class FlopIndex(object):
+    """The flops stored under one preflop node, indexed by flop class"""
+
+    def __init__(self, flop_table, flops):
+        self.flop_table = flop_table
+        self.flops = set(flops)
+        self.by_class = {}
+        for flop in flops:
+            class_id = flop_table.class_of(flop)
+            if class_id >= 0:
+                self.by_class.setdefault(class_id, flop)
+
+    def match(self, cards):
+        """
+        Returns (sorted flop, stored flop) for a list of three flop cards.
+        The stored flop is the sorted flop itself if the tree has it, else
+        the first stored flop of the same class, else None.
+        """
+        _id = flop_id(cards)
+        flop = self.flop_table.sorted_flops[_id]
+        if flop in self.flops:
+            return flop, flop
+        return flop, self.by_class.get(self.flop_table.class_ids[_id])
+
+
+_flop_table = None
+
+
+def get_flop_table():
+    """Builds the flop table on first use and shares it afterwards"""
+    global _flop_table
+    if _flop_table is None:
+        _flop_table = FlopTable()
+    return _flop_table
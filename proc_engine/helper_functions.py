@@ -1,22 +1,24 @@
-import time
 import re
-import sqlite3
-import pandas as pd
-import sys
-import boto3
-import paramiko
-from botocore.exceptions import NoCredentialsError
 import os
-import psycopg2
-import pymongo
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from . import __base__
+from .moves_tree import MovesTree, MovesTreeFile
+from .categories import CategoryTable
+from .flops import FLOP_SIZE, FlopIndex, get_flop_table
+from .lru_cache import LRUCache
+from .node_cache import NodeCache
+
+_missing = object()
+# Columns of a columnar run_many batch
+DECISION_FIELDS = ("cards", "action_sequence", "stacksize", "rake", "number_of_players")
 
 
 class Helper(object):
     """Helper functions for the processing"""
 
-    def __init__(self):
+    def __init__(self, **kwargs):
         self.alpha_ranks = [
             "Ac", "Ad", "Ah", "As",
             "Kc", "Kd", "Kh", "Ks",
@@ -48,6 +50,11 @@ class Helper(object):
             "2s", "2h", "2d", "2c",
         ]
 
+        self.alpha_rank_index = {card: i for i,
+                                 card in enumerate(self.alpha_ranks)}
+        self.anti_alpha_rank_index = {card: i for i,
+                                      card in enumerate(self.anti_alpha_ranks)}
+
         self.configdict = __base__.configdict
         self.dbs = [
             "PLO50_50BB_2P", "PLO50_100BB_2P",
@@ -56,30 +63,83 @@ class Helper(object):
             "PLO50_30BB_6P", "PLO50_50BB_6P", "PLO50_100BB_6P",
             "PLO500_30BB_6P", "PLO500_50BB_6P", "PLO500_100BB_6P", "PLO500_150BB_6P"
         ]
-        self.conn = dict()
-        self.cursordict = dict()
-        self.movesdb = dict()
-        self.mongoconn = pymongo.MongoClient("mongodb://{}:{}@{}:{}".format(
-            self.configdict.get("MONGO_USER"),
-            self.configdict.get("MONGO_PWD"),
-            self.configdict.get("MONGO_HOST"),
-            self.configdict.get("MONGO_PORT")
-        ))
-        self.category_db = self.mongoconn["ranges"]["card_ranges"]
-        for db in self.dbs:
-            try:
-                self.conn[db] = psycopg2.connect("postgresql://{}:{}@{}:{}/{}".format(
-                    self.configdict.get("PG_USER"),
-                    self.configdict.get("PG_PWD"),
-                    self.configdict.get("PG_HOST"),
-                    self.configdict.get("PG_PORT"),
-                    db))
-                self.cursordict[db] = self.conn[db].cursor()
-                self.movesdb[db] = self.mongoconn[self.configdict.get(
-                    "MOVES_DB_NAME")][db]
-            except Exception as e:
-                print(e)
-                logging.error("Could not connect to database {}".format(db))
+        self.lookup_threads = kwargs.get(
+            "lookup_threads", self.configdict.get("LOOKUP_THREADS", 8))
+        self._executor = None
+        # Tables that exist in each database, and queries skipped thanks to them
+        self.table_catalogs = dict()
+        self.avoided_queries = 0
+        self.lock = threading.RLock()
+        self.moves_trees = dict()
+        # Trees compiled by moves_tree.py, read instead of the store when present
+        self.moves_tree_file = kwargs.get(
+            "moves_tree_file", self.configdict.get("MOVES_TREE_FILE"))
+        self._tree_file = None
+        self.flop_indexes = dict()
+        self.flop_suit_maps = dict()
+        # run_everything results keyed by (cards, action_sequence, dbname)
+        self.result_cache = LRUCache(
+            max_entries=kwargs.get("result_cache_entries", self.configdict.get(
+                "RESULT_CACHE_ENTRIES")),
+            max_bytes=kwargs.get("result_cache_bytes", self.configdict.get(
+                "RESULT_CACHE_BYTES")))
+        self.category_file = kwargs.get(
+            "category_file", self.configdict.get("CATEGORY_FILE"))
+        self._category_table = None
+        # Where moves trees, solver tables and categories are read from
+        self.store = kwargs.get(
+            "store", self.configdict.get("STRATEGY_STORE", "postgres"))
+        if isinstance(self.store, str):
+            from .stores import make_store
+            self.store = make_store(
+                self.store, self.configdict,
+                pool_size=kwargs.get(
+                    "pool_size", self.configdict.get("PG_POOL_SIZE", 8)),
+                max_prepared_statements=kwargs.get(
+                    "max_prepared_statements", self.configdict.get("PREPARED_STATEMENTS_PER_CONNECTION", 256)))
+        # Serve strategy rows from mmap'd packs instead of the store
+        self.use_pack = kwargs.get(
+            "use_pack", self.configdict.get("USE_STRATEGY_PACK", False))
+        if self.use_pack:
+            from .stores import PackStore
+            self.store = PackStore(kwargs.get(
+                "pack_dir", self.configdict.get("STRATEGY_PACK_DIR")), self.store)
+        # Read whole strategies from the table built by best_actions.py
+        self.use_best_actions = kwargs.get(
+            "use_best_actions", self.configdict.get("USE_BEST_ACTIONS", False))
+        if self.use_best_actions and not self.store.has_best_actions:
+            raise ValueError("USE_BEST_ACTIONS needs a store with a best action table, {} has none".format(
+                type(self.store).__name__))
+        # Load every combo of a node's child tables on the first lookup at it
+        self.node_cache = None
+        if kwargs.get("use_node_cache", self.configdict.get("USE_NODE_CACHE", False)):
+            self.node_cache = NodeCache(
+                self.load_table_arrays, self.fetch_tables_rows, max_bytes=kwargs.get(
+                    "node_cache_bytes", self.configdict.get("NODE_CACHE_BYTES")))
+        # Whole node strategies for get_node_range, created on first use
+        self._node_ranges = None
+        self.range_cache_bytes = kwargs.get(
+            "range_cache_bytes", self.configdict.get("RANGE_CACHE_BYTES"))
+        # Lookups persisted across restarts, per solver version of each dbname
+        self.disk_cache = None
+        if kwargs.get("use_disk_cache", self.configdict.get("USE_DISK_CACHE", False)):
+            from .disk_cache import DiskCache
+            self.disk_cache = DiskCache(kwargs.get(
+                "disk_cache_file", self.configdict.get("DISK_CACHE_FILE")))
+        self.solver_versions = dict()
+        # Route the synchronous lookups through the asyncio engine
+        self.use_async = kwargs.get(
+            "use_async", self.configdict.get("USE_ASYNC_LOOKUPS", False))
+        self.async_concurrency = kwargs.get(
+            "async_concurrency", self.configdict.get("ASYNC_CONCURRENCY", 32))
+        self._async_engine = None
+        # Lookups per (dbname, node), the histogram warm_up preloads from
+        self.access_stats = None
+        if kwargs.get("record_access_stats", self.configdict.get("RECORD_ACCESS_STATS", False)):
+            from .access_stats import AccessStats
+            self.access_stats = AccessStats(
+                kwargs.get("access_stats_file", self.configdict.get("ACCESS_STATS_FILE")),
+                flush_seconds=self.configdict.get("ACCESS_STATS_FLUSH_SECONDS", 60))
 
         self.table_name_regex = re.compile(r'\w+')
         self.mapping = {"raise": "r", "fold": "f", "call": "c", "bet": "b",
@@ -141,6 +201,60 @@ class Helper(object):
         }
         self.card_regex = re.compile(r'[2-9AKQJT][sdch]')
 
+        # Moves trees and category table published by a parent process
+        self.shared_data = None
+        if kwargs.get("shared_data") is not None:
+            from .shared_data import SharedData
+            SharedData.attach(kwargs.get("shared_data")).install(self)
+
+    @property
+    def category_table(self):
+        with self.lock:
+            if self._category_table is None:
+                self._category_table = self.load_category_table()
+        return self._category_table
+
+    @property
+    def executor(self):
+        """Thread pool the table queries are fanned out on"""
+        with self.lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.lookup_threads, thread_name_prefix="lookup")
+        return self._executor
+
+    @property
+    def async_engine(self):
+        """Event loop the async lookups run on, started on first use"""
+        with self.lock:
+            if self._async_engine is None:
+                from .async_engine import AsyncLookupEngine
+                self._async_engine = AsyncLookupEngine(
+                    self, max_concurrency=self.async_concurrency)
+        return self._async_engine
+
+    def connection(self, dbname):
+        """Borrows a Postgres connection of dbname, for tools that need SQL"""
+        return self.store.connection(dbname)
+
+    def close(self):
+        """Closes the lookup threads and the store's connections"""
+        with self.lock:
+            if self._node_ranges is not None:
+                self._node_ranges.clear()
+            if self._async_engine is not None:
+                self._async_engine.close()
+                self._async_engine = None
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            self.store.close()
+            self.table_catalogs.clear()
+            if self.access_stats is not None:
+                self.access_stats.close()
+            if self.disk_cache is not None:
+                self.disk_cache.close()
+
     def rearrange_cards_alphabetically(self, cards: str, _reversed=False) -> str:
         """
         Inputs:
@@ -155,7 +269,7 @@ class Helper(object):
             assert len(cards) % 2 == 0, "Length of cards should be even"
             cards = [cards[i:i+2] for i in range(0, len(cards), 2)]
         return "".join(sorted(cards,
-                              key=self.alpha_ranks.index,
+                              key=self.alpha_rank_index.__getitem__,
                               reverse=_reversed)
                        )
 
@@ -173,7 +287,7 @@ class Helper(object):
             assert len(cards) % 2 == 0, "Length of cards should be even"
             cards = [cards[i:i+2] for i in range(0, len(cards), 2)]
         return "".join(sorted(cards,
-                              key=self.anti_alpha_ranks.index,
+                              key=self.anti_alpha_rank_index.__getitem__,
                               reverse=_reversed)
                        )
 
@@ -208,11 +322,35 @@ class Helper(object):
             key = keys.pop(0)
             return self.search_dict(keys, dictionary[key])
 
+    def get_moves_tree(self, dbname):
+        """Loads the moves tree of dbname once and keeps it compiled in memory"""
+        tree = self.moves_trees.get(dbname)
+        if tree is None:
+            with self.lock:
+                tree = self.moves_trees.get(dbname)
+                if tree is None:
+                    tree = self.load_moves_tree(dbname)
+                    self.moves_trees[dbname] = tree
+        return tree
+
+    def load_moves_tree(self, dbname):
+        """
+        Takes the tree of dbname from the compiled trees file if it has it,
+        without querying the store, else compiles the store's document.
+        The file is trusted, moves_tree.py --check finds its stale trees.
+        """
+        if self.moves_tree_file and os.path.isfile(self.moves_tree_file):
+            if self._tree_file is None:
+                self._tree_file = MovesTreeFile(self.moves_tree_file)
+            tree = self._tree_file.trees.get(dbname)
+            if tree is not None:
+                return tree
+        data = self.store.get_moves_document(dbname)
+        return MovesTree(data if data is not None else {})
+
     def search_moves(self, initial_moves, dbname):
         """Searching next moves"""
-        collection = self.movesdb[dbname]
-        data = collection.find_one()
-        list_of_next_moves = self.search_dict(initial_moves.copy(), data)
+        list_of_next_moves = self.get_moves_tree(dbname).search(initial_moves)
         return list_of_next_moves
 
     def _dissect_cards(self, cards: str):
@@ -298,13 +436,49 @@ class Helper(object):
             src_cards[i+1] = flop_changes[src_cards[i+1]]
         return "".join(src_cards)
 
+    def get_flop_index(self, short_preflop_moves, dbname):
+        """FlopIndex of the flops stored under a preflop node, None if the node is not in the tree"""
+        tree = self.get_moves_tree(dbname)
+        node_id = tree.find_node(short_preflop_moves)
+        key = (dbname, node_id)
+        flop_index = self.flop_indexes.get(key)
+        if flop_index is None:
+            flops = tree.search(short_preflop_moves)
+            if flops is None:
+                return None
+            flop_index = FlopIndex(get_flop_table(), flops)
+            self.flop_indexes[key] = flop_index
+        return flop_index
+
+    def get_suit_map(self, src_flop, dst_flop):
+        """Suit -> suit map that change_cards applies for (src_flop, dst_flop), computed once"""
+        key = (src_flop, dst_flop)
+        suit_map = self.flop_suit_maps.get(key)
+        if suit_map is None:
+            suit_map = self.reverse_dictionary(
+                self.find_flop_changes(src_flop, dst_flop))
+            self.flop_suit_maps[key] = suit_map
+        return suit_map
+
+    def remap_cards(self, cards, src_flop, dst_flop):
+        """
+        change_cards with the suit map of each (src_flop, dst_flop) pair
+        computed once, the changed hand put back in alphabetical order as
+        the solver tables store it
+        """
+        suit_map = self.get_suit_map(src_flop, dst_flop)
+        cards = list(cards)
+        for i in range(0, len(cards), 2):
+            cards[i+1] = suit_map[cards[i+1]]
+        return self.rearrange_cards_alphabetically("".join(cards))
+
     def get_table_names_from_db(self, initial_moves, list_of_next_moves):
         """Getting table names from initial moves"""
         if list_of_next_moves is not None:
             return {key: "_".join([*initial_moves, key]) for key in list_of_next_moves}
 
-    def search_tables_with_cards(self, cards, long_moves_string, dbname, short=False):
-        """Search table for cards and get weight, and ev"""
+    def plan_tables_with_cards(self, long_moves_string, dbname, short=False):
+        """Returns the child tables to look up for a node, or None if the node is not in the tree"""
         if long_moves_string[-2:] == '_h':
             long_moves_string = long_moves_string[-2:]
         if not short:
@@ -315,18 +489,75 @@ class Helper(object):
         list_of_next_moves = self.search_moves(initial_moves, dbname)
         if list_of_next_moves is None:
             return None
-        next_tables = self.get_table_names_from_db(
+        return self.get_table_names_from_db(
             initial_moves, list_of_next_moves)
+
+    def get_table_catalog(self, dbname):
+        """Names of the solver tables of dbname, loaded once"""
+        catalog = self.table_catalogs.get(dbname)
+        if catalog is None:
+            catalog = frozenset(self.store.get_table_names(dbname))
+            self.table_catalogs[dbname] = catalog
+        return catalog
+
+    def get_solver_version(self, dbname):
+        """
+        Version stamp of the solver data of dbname: SOLVER_VERSION plus the
+        store's own stamp, which changes whenever the data is reloaded.
+        """
+        version = self.solver_versions.get(dbname)
+        if version is None:
+            version = "{}:{}".format(self.configdict.get(
+                "SOLVER_VERSION"), self.store.get_version(dbname))
+            if self.disk_cache is not None:
+                self.disk_cache.check_version(dbname, version)
+            self.solver_versions[dbname] = version
+        return version
+
+    def fetch_table_rows(self, dbname, table, combos):
+        """
+        Fetches the rows of combos from one solver table with a single
+        store query. Returns a dict of combo -> (weight, ev)
+        """
+        if table not in self.get_table_catalog(dbname):
+            with self.lock:
+                self.avoided_queries += 1
+            return {}
+        return self.store.fetch_table_rows(dbname, table, combos)
+
+    def fetch_tables_rows(self, dbname, tables, combos):
+        """
+        fetch_table_rows for several tables of dbname in one store query.
+        Returns a dict of table -> combo -> (weight, ev)
+        """
+        catalog = self.get_table_catalog(dbname)
+        present = [table for table in tables if table in catalog]
+        if len(present) < len(tables):
+            with self.lock:
+                self.avoided_queries += len(tables) - len(present)
+        table_rows = {table: {} for table in tables}
+        if len(present):
+            table_rows.update(self.store.fetch_tables_rows(dbname, present, combos))
+        return table_rows
+
+    def load_table_arrays(self, dbname, table):
+        """Every row of one solver table as a TableArrays, for the node cache"""
+        if table not in self.get_table_catalog(dbname):
+            with self.lock:
+                self.avoided_queries += 1
+            return {}
+        return self.store.load_table_arrays(dbname, table)
+
+    def build_strategy(self, cards, next_tables, table_rows):
+        """Builds the normalised move -> weight/ev dict from fetched table rows"""
         ret_dict = {}
         for move in next_tables:
             full_move = self.reverse_mapping_func(move)
-            self.cursordict[dbname].execute(
-                "SELECT * FROM \"{}\" WHERE combo = '{}';".format(next_tables[move], cards))
-            res = self.cursordict[dbname].fetchall()
-            if len(res):
+            res = table_rows[next_tables[move]].get(cards)
+            if res is not None:
                 ret_dict[full_move] = {
-                    "weight": res[0][1],
-                    "ev": res[0][2]
+                    "weight": res[0],
+                    "ev": res[1]
                 }
         if len(ret_dict) == 0:
             return "Could not find cards"
@@ -337,9 +568,85 @@ class Helper(object):
             ret_dict[move]['weight'] /= sum_
         return ret_dict
 
-    def search_tables(self, cards, long_moves_string, dbname):
+    def try_build_strategy(self, cards, next_tables, table_rows):
+        """build_strategy for a batch, returning the exception if it raised"""
+        try:
+            return self.build_strategy(cards, next_tables, table_rows)
+        except Exception as e:
+            return e
+
+    def get_node_name(self, next_tables):
+        """Short name of the node whose child tables are next_tables"""
+        for move, table in next_tables.items():
+            return table[:-len(move) - 1]
+
+    def fetch_best_actions(self, dbname, node, combos):
+        """
+        Reads the materialised strategies of combos at node with one indexed
+        query. Returns a dict of combo -> strategy dict, as build_strategy makes it
+        """
+        if node is None:
+            return {}
+        return self.store.fetch_best_actions(dbname, node, combos)
+
+    def fetch_strategy(self, cards, next_tables, dbname):
+        """Looks cards up in each of next_tables and builds the strategy dict"""
+        if next_tables is None:
+            return None
+        if self.use_best_actions:
+            strategies = self.fetch_best_actions(
+                dbname, self.get_node_name(next_tables), [cards])
+            return strategies.get(cards, "Could not find cards")
+        tables = list(next_tables.values())
+        if self.node_cache is not None:
+            table_rows = self.node_cache.get_node(
+                dbname, self.get_node_name(next_tables), tables, [cards])
+            return self.build_strategy(cards, next_tables, table_rows)
+        if self.store.batches_tables:
+            return self.build_strategy(cards, next_tables, self.fetch_tables_rows(
+                dbname, tables, [cards]))
+        table_rows = dict(zip(tables, self.executor.map(
+            lambda table: self.fetch_table_rows(dbname, table, [cards]), tables)))
+        return self.build_strategy(cards, next_tables, table_rows)
+
+    def search_tables_with_cards(self, cards, long_moves_string, dbname, short=False):
+        """Search table for cards and get weight, and ev"""
+        next_tables = self.plan_tables_with_cards(
+            long_moves_string, dbname, short=short)
+        return self.fetch_strategy(cards, next_tables, dbname)
+
+    def plan_tables(self, cards, long_moves_string, dbname):
+        """
+        Works out what search_tables would query, without querying.
+        Returns a (cards, next_tables) tuple, or the final result when
+        there is nothing to look up (None or a message string).
+        """
         flop = self.card_regex.findall(long_moves_string)
-        if len(flop):
+        if len(flop) == FLOP_SIZE and len(set(flop)) == FLOP_SIZE:
+            flop_cards = flop
+            flop = "".join(flop)
+            preflop, postflop = long_moves_string.split(flop)
+            short_preflop = self.get_short_table_name(preflop)
+            flop_index = self.get_flop_index(short_preflop.split("_"), dbname)
+            if flop_index is None:
+                # Reported as an error for the hand, as the flop scan always was
+                raise ValueError("No flops stored after {} in {}".format(short_preflop, dbname))
+            rearranged_flop, stored_flop = flop_index.match(flop_cards)
+            if stored_flop == rearranged_flop:
+                rearranged_short_table_name = "_".join(
+                    [short_preflop, rearranged_flop, self.get_short_table_name(postflop)])
+                if cards is None:
+                    return "Cards are none"
+                return cards, self.plan_tables_with_cards(rearranged_short_table_name, dbname, short=True)
+            if stored_flop is not None:
+                changed_cards = self.remap_cards(
+                    cards, rearranged_flop, stored_flop)
+                rearranged_short_table_name = "_".join(
+                    [short_preflop, stored_flop, self.get_short_table_name(postflop)])
+                if cards is None:
+                    return "Cards are none"
+                return changed_cards, self.plan_tables_with_cards(rearranged_short_table_name, dbname, short=True)
+        elif len(flop):
             flop = "".join(flop)
             preflop, postflop = long_moves_string.split(flop)
             short_preflop = self.get_short_table_name(preflop)
@@ -350,27 +657,277 @@ class Helper(object):
                     [short_preflop, rearranged_flop, self.get_short_table_name(postflop)])
                 if cards is None:
                     return "Cards are none"
-                return self.search_tables_with_cards(cards, rearranged_short_table_name, dbname, short=True)
+                return cards, self.plan_tables_with_cards(rearranged_short_table_name, dbname, short=True)
 
             for flop in flops:
                 if rearranged_flop[0] == flop[0] and rearranged_flop[2] == flop[2] and rearranged_flop[4] == flop[4]:
                     changes = self.find_flop_changes(rearranged_flop, flop)
                     if changes is not None:
-                        changed_cards = self.change_cards(
-                            cards, rearranged_flop, flop)
+                        changed_cards = self.rearrange_cards_alphabetically(
+                            self.change_cards(cards, rearranged_flop, flop))
                         rearranged_short_table_name = "_".join(
                             [short_preflop, flop, self.get_short_table_name(postflop)])
                         if cards is None:
                             return "Cards are none"
-                        return self.search_tables_with_cards(changed_cards, rearranged_short_table_name, dbname, short=True)
+                        return changed_cards, self.plan_tables_with_cards(rearranged_short_table_name, dbname, short=True)
         if cards is None:
             return "cards are none"
-        return self.search_tables_with_cards(cards, long_moves_string, dbname)
+        return cards, self.plan_tables_with_cards(long_moves_string, dbname)
+
+    def plan_range(self, long_moves_string, dbname):
+        """
+        plan_tables for a whole range rather than one hand. Returns a
+        (suit_map, next_tables) tuple, suit_map being None unless the
+        flop is stored with other suits, or None if the node is not in the tree.
+        """
+        flop = self.card_regex.findall(long_moves_string)
+        if len(flop) == FLOP_SIZE and len(set(flop)) == FLOP_SIZE:
+            preflop, postflop = long_moves_string.split("".join(flop))
+            short_preflop = self.get_short_table_name(preflop)
+            flop_index = self.get_flop_index(short_preflop.split("_"), dbname)
+            if flop_index is None:
+                return None
+            rearranged_flop, stored_flop = flop_index.match(flop)
+            if stored_flop is not None:
+                suit_map = None
+                if stored_flop != rearranged_flop:
+                    suit_map = self.get_suit_map(rearranged_flop, stored_flop)
+                next_tables = self.plan_tables_with_cards("_".join(
+                    [short_preflop, stored_flop, self.get_short_table_name(postflop)]),
+                    dbname, short=True)
+                if next_tables is None:
+                    return None
+                return suit_map, next_tables
+        next_tables = self.plan_tables_with_cards(long_moves_string, dbname)
+        if next_tables is None:
+            return None
+        return None, next_tables
+
+    @property
+    def node_ranges(self):
+        with self.lock:
+            if self._node_ranges is None:
+                from .node_ranges import NodeRanges
+                self._node_ranges = NodeRanges(
+                    self.load_table_arrays, self.reverse_mapping_func,
+                    max_bytes=self.range_cache_bytes)
+        return self._node_ranges
+
+    def get_node_range(self, dbname, action_sequence):
+        """
+        The solver strategy of every combo at the node action_sequence
+        leads to, for range reports: a dict of move -> {"weight": array,
+        "ev": array}, the arrays indexed by combo id (see combos.py).
+        One bulk read per child table, nodes are cached. None if the node
+        is not in the tree.
+        """
+        plan = self.plan_range(action_sequence, dbname)
+        if plan is None:
+            return None
+        suit_map, next_tables = plan
+        if not len(next_tables):
+            return {}
+        node = self.get_node_name(next_tables)
+        self.record_access(dbname, node, miss=not self.node_ranges.has_node(dbname, node))
+        strategy = self.node_ranges.get(dbname, node, next_tables)
+        if suit_map is not None:
+            strategy = self.node_ranges.remap(strategy, suit_map)
+        return strategy
+
+    def search_tables(self, cards, long_moves_string, dbname):
+        plan = self.plan_tables(cards, long_moves_string, dbname)
+        if not isinstance(plan, tuple):
+            return plan
+        cards, next_tables = plan
+        if next_tables is None or not len(next_tables):
+            return self.fetch_strategy(cards, next_tables, dbname)
+        node = self.get_node_name(next_tables)
+        if self.disk_cache is None:
+            self.record_access(dbname, node, miss=not self.node_cached(dbname, node))
+            return self.fetch_strategy(cards, next_tables, dbname)
+        self.get_solver_version(dbname)
+        data = self.disk_cache.get(dbname, node, cards)
+        self.record_access(dbname, node, miss=data is None and not self.node_cached(dbname, node))
+        if data is None:
+            data = self.fetch_strategy(cards, next_tables, dbname)
+            self.disk_cache.put_many(dbname, [(node, cards, data)])
+        return data
+
+    def node_cached(self, dbname, node):
+        """Whether the node cache can answer lookups at node without the store"""
+        return (self.node_cache is not None and not self.use_best_actions
+                and self.node_cache.has_node(dbname, node))
+
+    def record_access(self, dbname, node, miss=False):
+        if self.access_stats is not None:
+            self.access_stats.record(dbname, node, miss=miss)
+
+    def warm_up(self, max_bytes=None):
+        """
+        Preloads the most accessed nodes of the access stats, hottest first:
+        moves trees and table catalogs always, whole nodes into the node
+        cache until the next one would take it over max_bytes (the node
+        cache budget by default). Returns the number of nodes preloaded.
+        """
+        if self.access_stats is None:
+            return 0
+        if self.node_cache is not None and max_bytes is None:
+            max_bytes = self.node_cache.nodes.max_bytes
+        loaded = 0
+        used = 0
+        for dbname, node, accesses, misses in self.access_stats.hottest():
+            try:
+                path = node.split("_")
+                next_tables = self.get_table_names_from_db(
+                    path, self.search_moves(path, dbname))
+                self.get_table_catalog(dbname)
+                if self.node_cache is None or not next_tables:
+                    continue
+                size = self.node_cache.preload(
+                    dbname, node, list(next_tables.values()),
+                    None if max_bytes is None else max_bytes - used)
+                if size is None:
+                    break
+                used += size
+                loaded += 1
+            except Exception as e:
+                logging.error("Could not warm up {} {}: {}".format(dbname, node, e))
+        return loaded
+
+    @property
+    def groups_by_node(self):
+        """True when a batch fetches whole nodes rather than single tables"""
+        return self.use_best_actions or self.node_cache is not None or self.store.batches_tables
+
+    def search_tables_batch(self, lookups):
+        """
+        Batched search_tables. Takes a list of (cards, long_moves_string, dbname)
+        and returns the results in the same order, issuing one query per
+        solver table for all the combos requested from it. With
+        use_best_actions or a store that batches tables there is one query
+        per node instead, and with the node cache each node is loaded whole
+        once. Lookups found in the disk cache are not fetched at all.
+        A lookup that raised gets the exception as its result.
+        """
+        batch = self._plan_batch(lookups)
+        if self.use_async:
+            fetched = self.async_engine.fetch_many(batch[2])
+        else:
+            fetched = list(self.executor.map(self.fetch_planned, batch[2]))
+        return self._finish_batch(batch, fetched)
+
+    async def search_tables_batch_async(self, lookups):
+        """search_tables_batch with the queries awaited on the async engine"""
+        batch = self._plan_batch(lookups)
+        fetched = await self.async_engine.fetch_many_async(batch[2])
+        return self._finish_batch(batch, fetched)
+
+    def _plan_batch(self, lookups):
+        """
+        Plans a batch. Returns the results known without fetching, the plan
+        of each lookup left and the fetches as ((dbname, table or node), combos, tables)
+        """
+        results = [None] * len(lookups)
+        plans = {}
+        wanted = {}
+        node_tables = {}
+        for i, (cards, long_moves_string, dbname) in enumerate(lookups):
+            try:
+                plan = self.plan_tables(cards, long_moves_string, dbname)
+            except Exception as e:
+                results[i] = e
+                continue
+            if not isinstance(plan, tuple):
+                results[i] = plan
+                continue
+            cards, next_tables = plan
+            if next_tables is None:
+                continue
+            if self.disk_cache is not None and len(next_tables):
+                try:
+                    self.get_solver_version(dbname)
+                    data = self.disk_cache.get(
+                        dbname, self.get_node_name(next_tables), cards)
+                except Exception as e:
+                    results[i] = e
+                    continue
+                if data is not None:
+                    self.record_access(dbname, self.get_node_name(next_tables))
+                    results[i] = data
+                    continue
+            if len(next_tables):
+                node = self.get_node_name(next_tables)
+                self.record_access(dbname, node, miss=not self.node_cached(dbname, node))
+            plans[i] = (cards, next_tables, dbname)
+            if self.groups_by_node:
+                node = self.get_node_name(next_tables)
+                wanted.setdefault((dbname, node), set()).add(cards)
+                node_tables.setdefault((dbname, node), list(next_tables.values()))
+                continue
+            for table in next_tables.values():
+                wanted.setdefault((dbname, table), set()).add(cards)
+        fetches = [(key, sorted(combos), node_tables.get(key))
+                   for key, combos in wanted.items()]
+        return results, plans, fetches
+
+    def fetch_planned(self, fetch):
+        """Runs one fetch of a planned batch, returning the exception if it raised"""
+        (dbname, name), combos, tables = fetch
+        try:
+            if self.use_best_actions:
+                return self.fetch_best_actions(dbname, name, combos)
+            if self.node_cache is not None:
+                return self.node_cache.get_node(dbname, name, tables, combos)
+            if self.store.batches_tables:
+                return self.fetch_tables_rows(dbname, tables, combos)
+            return self.fetch_table_rows(dbname, name, combos)
+        except Exception as e:
+            return e
+
+    def _finish_batch(self, batch, fetched):
+        """Builds the results of a planned batch from what its fetches returned"""
+        results, plans, fetches = batch
+        fetched = {fetch[0]: rows for fetch, rows in zip(fetches, fetched)}
+        for i, (cards, next_tables, dbname) in plans.items():
+            if self.groups_by_node:
+                rows = fetched[(dbname, self.get_node_name(next_tables))]
+                if isinstance(rows, Exception):
+                    results[i] = rows
+                elif self.use_best_actions:
+                    results[i] = rows.get(cards, "Could not find cards")
+                else:
+                    results[i] = self.try_build_strategy(cards, next_tables, rows)
+                continue
+            table_rows = {}
+            for table in next_tables.values():
+                rows = fetched[(dbname, table)]
+                if isinstance(rows, Exception):
+                    results[i] = rows
+                    break
+                table_rows[table] = rows
+            else:
+                results[i] = self.try_build_strategy(cards, next_tables, table_rows)
+
+        if self.disk_cache is not None:
+            new_rows = {}
+            for i, (cards, next_tables, dbname) in plans.items():
+                if len(next_tables) and not isinstance(results[i], Exception):
+                    new_rows.setdefault(dbname, []).append(
+                        (self.get_node_name(next_tables), cards, results[i]))
+            for dbname, rows in new_rows.items():
+                self.disk_cache.put_many(dbname, rows)
+        return results
+
+    def load_category_table(self):
+        """Loads card_ranges from the local category file if there is one, else from the store"""
+        if self.category_file and os.path.isfile(self.category_file):
+            return CategoryTable.load(self.category_file)
+        return self.store.get_category_table()
 
     def get_category(self, cards: str):
-        return self.category_db.find_one({"cards": self.rearrange_cards_alphabetically(cards)})
+        return self.category_table.get(self.rearrange_cards_alphabetically(cards))
 
-    def run_everything(self, cards: str, action_sequence: str, stacksize: int, rake: int, number_of_players: int):
+    def get_dbname(self, stacksize: int, rake: int, number_of_players: int):
         if rake == 5000:
             if number_of_players == 2:
                 if stacksize < 70:
@@ -420,11 +977,101 @@ class Helper(object):
                     dbname = "PLO500_150BB_6P"
                 else:
                     dbname = "PLO500_150BB_6P"
+        return dbname
+
+    def copy_result(self, data):
+        """Copies a cached result so callers cannot change the cached one"""
+        if isinstance(data, dict):
+            return {move: dict(value) for move, value in data.items()}
+        return data
+
+    def run_everything(self, cards: str, action_sequence: str, stacksize: int, rake: int, number_of_players: int):
+        if self.use_async:
+            data = self.run_many(
+                [(cards, action_sequence, stacksize, rake, number_of_players)])[0]
+            if isinstance(data, Exception):
+                raise data
+            return data
+        dbname = self.get_dbname(stacksize, rake, number_of_players)
         if cards is not None:
             cards = self.rearrange_cards_alphabetically(cards)
-        data = self.search_tables(cards, action_sequence, dbname)
+        key = (cards, action_sequence, dbname)
+        data = self.result_cache.get(key, _missing)
+        if data is _missing:
+            data = self.search_tables(cards, action_sequence, dbname)
+            self.result_cache.put(key, data)
+        return self.copy_result(data)
+
+    async def run_everything_async(self, cards: str, action_sequence: str, stacksize: int, rake: int, number_of_players: int):
+        data = (await self.run_many_async(
+            [(cards, action_sequence, stacksize, rake, number_of_players)]))[0]
+        if isinstance(data, Exception):
+            raise data
         return data
 
+    def run_many(self, decisions):
+        """
+        Evaluates a batch of hero decisions. decisions is either a list of
+        (cards, action_sequence, stacksize, rake, number_of_players) tuples
+        or columns of those five (a dict of equal length lists, a DataFrame).
+        Identical decisions are looked up once and the lookups are grouped by
+        dbname and node. Returns the run_everything results in input order,
+        a decision that raised gets the exception as its result.
+        """
+        results, lookups, positions = self._prepare_decisions(decisions)
+        return self._finish_decisions(
+            results, lookups, positions, self.search_tables_batch(lookups))
+
+    async def run_many_async(self, decisions):
+        """run_many with all of its queries awaited together"""
+        results, lookups, positions = self._prepare_decisions(decisions)
+        return self._finish_decisions(
+            results, lookups, positions, await self.search_tables_batch_async(lookups))
+
+    def _prepare_decisions(self, decisions):
+        """
+        Answers decisions from the result cache. Returns the unique lookups
+        left to search and, for each of them, the decisions waiting on it.
+        """
+        if hasattr(decisions, "keys"):
+            columns = [list(decisions[field]) for field in DECISION_FIELDS]
+            # Missing cards come out of a DataFrame as NaN
+            columns[0] = [None if isinstance(cards, float) else cards
+                          for cards in columns[0]]
+            decisions = list(zip(*columns))
+        results = [None] * len(decisions)
+        lookups = []
+        positions = []
+        pending = dict()
+        for i, (cards, action_sequence, stacksize, rake, number_of_players) in enumerate(decisions):
+            try:
+                dbname = self.get_dbname(stacksize, rake, number_of_players)
+                if cards is not None:
+                    cards = self.rearrange_cards_alphabetically(cards)
+            except Exception as e:
+                results[i] = e
+                continue
+            key = (cards, action_sequence, dbname)
+            if key in pending:
+                positions[pending[key]].append(i)
+                continue
+            data = self.result_cache.get(key, _missing)
+            if data is not _missing:
+                results[i] = self.copy_result(data)
+                continue
+            pending[key] = len(lookups)
+            lookups.append(key)
+            positions.append([i])
+        return results, lookups, positions
+
+    def _finish_decisions(self, results, lookups, positions, searched):
+        for lookup, indexes, data in zip(lookups, positions, searched):
+            if not isinstance(data, Exception):
+                self.result_cache.put(lookup, data)
+            for i in indexes:
+                results[i] = self.copy_result(data)
+        return results
+
 
 if __name__ == '__main__':
     helper = Helper()
@@ -0,0 +1,114 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def estimate_size(value):
+    """Rough deep size in bytes of the str/number/dict/list/tuple values we cache"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += estimate_size(key) + estimate_size(item)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            size += estimate_size(item)
+    return size
+
+
+class LRUCache(object):
+    """
+    Least recently used cache bounded by number of entries and/or bytes.
+    A limit of None means unbounded, a limit of 0 disables the cache.
+    on_evict(key, value) is called for every entry pushed out by the limits.
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.data = OrderedDict()
+        self.sizes = dict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    @property
+    def enabled(self):
+        return self.max_entries != 0 and self.max_bytes != 0
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.data.move_to_end(key)
+                self.hits += 1
+                return self.data[key]
+            self.misses += 1
+            return default
+
+    def peek(self, key, default=None):
+        """get without counting a hit or miss or refreshing the entry"""
+        with self.lock:
+            return self.data.get(key, default)
+
+    def put(self, key, value, size=None):
+        if not self.enabled:
+            return
+        if size is None:
+            size = estimate_size(key) + estimate_size(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.data:
+                self.current_bytes -= self.sizes[key]
+            self.data[key] = value
+            self.data.move_to_end(key)
+            self.sizes[key] = size
+            self.current_bytes += size
+            self._evict()
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key in self.data:
+                self.current_bytes -= self.sizes.pop(key)
+                return self.data.pop(key)
+            return default
+
+    def _evict(self):
+        while len(self.data) and (
+                (self.max_entries is not None and len(self.data) > self.max_entries) or
+                (self.max_bytes is not None and self.current_bytes > self.max_bytes)):
+            key, value = self.data.popitem(last=False)
+            self.current_bytes -= self.sizes.pop(key)
+            self.evictions += 1
+            if self.on_evict is not None:
+                self.on_evict(key, value)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.sizes.clear()
+            self.current_bytes = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.data),
+                "bytes": self.current_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hit_rate()
+            }
@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+from array import array
+
+
+MAGIC = b"GTOTREE\0"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+ARRAYS = ("kinds", "child_offsets", "child_moves", "child_nodes")
+
+
+class MovesTree(object):
+    """
+    In-memory trie compiled from a moves_tree document.
+
+    Every node gets an integer id (the root is 0). The outgoing edges of
+    node n live in child_moves[child_offsets[n]:child_offsets[n+1]] and
+    child_nodes[...] for the same slice. Moves are interned into self.moves
+    and referenced by their code.
+
+    A node built from a list (the "h" entries of the tree) is a LIST node:
+    its edges are the list items and point to no child (-1).
+    """
+
+    DICT = 0
+    LIST = 1
+    LEAF = 2
+
+    def __init__(self, document=None):
+        self.moves = []
+        self.move_codes = {}
+        self.kinds = array('b')
+        self.child_offsets = array('i', [0])
+        self.child_moves = array('i')
+        self.child_nodes = array('i')
+        self._child_maps = {}
+        if document is not None:
+            self.compile(document)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @classmethod
+    def from_arrays(cls, moves, kinds, child_offsets, child_moves, child_nodes):
+        """A tree over already compiled arrays (arrays or memoryviews), nothing is copied"""
+        tree = cls()
+        for move in moves:
+            tree._move_code(move)
+        tree.kinds = kinds
+        tree.child_offsets = child_offsets
+        tree.child_moves = child_moves
+        tree.child_nodes = child_nodes
+        return tree
+
+    def _move_code(self, move):
+        code = self.move_codes.get(move)
+        if code is None:
+            code = len(self.moves)
+            self.moves.append(move)
+            self.move_codes[move] = code
+        return code
+
+    def compile(self, document):
+        """Compiles a nested dict/list document into flat node arrays"""
+        document = {key: value for key, value in document.items()
+                    if key != "_id"}
+        # Breadth first, so that the edges of node n are written before
+        # the edges of node n+1 and child_offsets stays monotonic.
+        queue = [document]
+        position = 0
+        while position < len(queue):
+            value = queue[position]
+            position += 1
+            if isinstance(value, dict):
+                self.kinds.append(self.DICT)
+                for key, child in value.items():
+                    self.child_moves.append(self._move_code(key))
+                    self.child_nodes.append(len(queue))
+                    queue.append(child)
+            elif isinstance(value, list):
+                self.kinds.append(self.LIST)
+                for item in value:
+                    self.child_moves.append(self._move_code(item))
+                    self.child_nodes.append(-1)
+            else:
+                self.kinds.append(self.LEAF)
+            self.child_offsets.append(len(self.child_moves))
+        return self
+
+    def edges(self, node_id):
+        start = self.child_offsets[node_id]
+        end = self.child_offsets[node_id + 1]
+        return start, end
+
+    def next_moves(self, node_id):
+        """Returns the moves going out of node_id, in document order"""
+        start, end = self.edges(node_id)
+        return [self.moves[code] for code in self.child_moves[start:end]]
+
+    def child(self, node_id, move):
+        """Returns the child node id for move, or None"""
+        child_map = self._child_maps.get(node_id)
+        if child_map is None:
+            start, end = self.edges(node_id)
+            child_map = {}
+            for i in range(start, end):
+                child_map.setdefault(
+                    self.moves[self.child_moves[i]], self.child_nodes[i])
+            self._child_maps[node_id] = child_map
+        return child_map.get(move)
+
+    def find_node(self, moves, node_id=0):
+        """Resolves an action path to a node id, or None if it is not in the tree"""
+        for move in moves:
+            if node_id is None or node_id < 0:
+                return None
+            node_id = self.child(node_id, move)
+        if node_id is None or node_id < 0:
+            return None
+        return node_id
+
+    def search(self, keys):
+        """
+        Same contract as Helper.search_dict: walks keys from the root and
+        returns the list of next moves at the end of the path, or None.
+        A list reached through "h" is returned without its "v" entry.
+        """
+        node_id = 0
+        for i, key in enumerate(keys):
+            if self.kinds[node_id] != self.DICT:
+                return None
+            child_id = self.child(node_id, key)
+            if child_id is None:
+                return None
+            kind = self.kinds[child_id]
+            if kind == self.LIST and key == 'h':
+                next_moves = self.next_moves(child_id)
+                if "v" in next_moves:
+                    next_moves.pop(next_moves.index("v"))
+                return next_moves
+            elif i == len(keys) - 1:
+                if kind != self.DICT:
+                    return None
+                return self.next_moves(child_id)
+            node_id = child_id
+
+    def lookup_nodes(self):
+        """
+        Yields (path, next_moves) for every path that search() resolves to
+        a list of next moves, i.e. every node that has child tables.
+        """
+        stack = [(0, [])]
+        while len(stack):
+            node_id, path = stack.pop()
+            start, end = self.edges(node_id)
+            for i in range(start, end):
+                move = self.moves[self.child_moves[i]]
+                child_id = self.child_nodes[i]
+                kind = self.kinds[child_id]
+                if kind == self.LIST and move == 'h':
+                    next_moves = self.next_moves(child_id)
+                    if "v" in next_moves:
+                        next_moves.pop(next_moves.index("v"))
+                    yield path + [move], next_moves
+                elif kind == self.DICT:
+                    yield path + [move], self.next_moves(child_id)
+                    stack.append((child_id, path + [move]))
+
+
+def document_version(document):
+    """
+    sha256 of a moves tree document (None for no document), which changes
+    whenever the document does. Mongo's _id is hashed as its string.
+    """
+    if document is None:
+        return None
+    return hashlib.sha256(json.dumps(
+        document, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def save_trees(trees, path, versions=None):
+    """
+    Writes a dict of dbname -> MovesTree into one file for MovesTreeFile.
+
+    Layout: header, JSON directory (moves of each tree, the offset, type
+    and length of each of its arrays, the document_version of the
+    document each tree was built from and a sha256 of the data), padding
+    to 8 bytes, then the little endian arrays. versions maps dbname to
+    that document version. The
+    output only depends on the trees and versions, so every host building
+    from the same documents gets the same file.
+    """
+    versions = versions or {}
+    chunks = []
+    offset = 0
+    directory = {}
+    for dbname in sorted(trees):
+        tree = trees[dbname]
+        entry = {"moves": list(tree.moves), "version": versions.get(dbname)}
+        for name in ARRAYS:
+            data = getattr(tree, name)
+            data = array(data.format if isinstance(data, memoryview) else data.typecode, data)
+            if sys.byteorder == "big":
+                data.byteswap()
+            padding = -offset % 8
+            chunks.append(bytes(padding))
+            offset += padding
+            entry[name] = [offset, data.typecode, len(data)]
+            chunks.append(data.tobytes())
+            offset += data.itemsize * len(data)
+        directory[dbname] = entry
+    body = b"".join(chunks)
+    directory = json.dumps({"checksum": hashlib.sha256(body).hexdigest(),
+                            "trees": directory}, sort_keys=True).encode()
+    padding = bytes(-(HEADER.size + len(directory)) % 8)
+
+    tmp_path = "{}.tmp".format(path)
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(directory)))
+        f.write(directory)
+        f.write(padding)
+        f.write(body)
+    os.replace(tmp_path, path)
+    return len(directory) + len(body)
+
+
+class MovesTreeFile(object):
+    """
+    Read only, mmap backed trees of a file written by save_trees. Opening
+    reads the directory only, verify checks the checksum of the whole data.
+    """
+
+    def __init__(self, path, verify=False):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, directory_len = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a moves tree file: {}".format(path))
+        offset = HEADER.size
+        directory = json.loads(self.mm[offset:offset + directory_len].decode())
+        offset += directory_len
+        self.data_offset = offset + -offset % 8
+        self.checksum = directory["checksum"]
+        if verify and hashlib.sha256(self.mm[self.data_offset:]).hexdigest() != self.checksum:
+            raise ValueError("Moves tree file {} is corrupt, its checksum does not match".format(path))
+        self.versions = {dbname: entry["version"]
+                         for dbname, entry in directory["trees"].items()}
+        self.trees = {dbname: self._tree(entry)
+                      for dbname, entry in directory["trees"].items()}
+
+    def _view(self, entry):
+        start, typecode, length = entry
+        start += self.data_offset
+        itemsize = array(typecode).itemsize
+        if sys.byteorder == "big":
+            data = array(typecode, self.mm[start:start + itemsize * length])
+            data.byteswap()
+            return data
+        return memoryview(self.mm)[start:start + itemsize * length].cast(typecode)
+
+    def _tree(self, entry):
+        return MovesTree.from_arrays(entry["moves"], *[
+            self._view(entry[name]) for name in ARRAYS])
+
+
+def stale_trees(path, documents):
+    """
+    dbnames of documents (dbname -> moves tree document) whose tree in the
+    file at path is missing, corrupt or compiled from another document.
+    Helper trusts the file, so this is the check to run before deploying it.
+    """
+    try:
+        versions = MovesTreeFile(path, verify=True).versions
+    except (OSError, ValueError):
+        return sorted(documents)
+    return sorted(dbname for dbname, document in documents.items()
+                  if dbname not in versions or versions[dbname] != document_version(document))
+
+
+if __name__ == '__main__':
+    from .helper_functions import Helper
+    helper = Helper(moves_tree_file=None)
+    path = helper.configdict.get("MOVES_TREE_FILE")
+    documents = {dbname: helper.store.get_moves_document(dbname) for dbname in helper.dbs}
+    stale = stale_trees(path, documents)
+    if "--check" in sys.argv[1:]:
+        print("Stale moves trees in {}: {}".format(path, ", ".join(stale) or "none"))
+        sys.exit(1 if len(stale) else 0)
+    trees = {dbname: MovesTree(document if document is not None else {})
+             for dbname, document in documents.items()}
+    versions = {dbname: document_version(document) for dbname, document in documents.items()}
+    size = save_trees(trees, path, versions)
+    print("Compiled {} moves trees into {} ({} bytes), {} of them changed".format(
+        len(trees), path, size, len(stale)))
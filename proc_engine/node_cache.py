@@ -0,0 +1,192 @@
+import math
+import threading
+from array import array
+from bisect import bisect_left
+from . import combos
+from .lru_cache import LRUCache, estimate_size
+from .strategy_pack import SPARSE_ROW_SIZE, DENSE_ROW_SIZE
+
+
+class TableArrays(object):
+    """
+    Every row of one solver table, laid out like a table of a strategy
+    pack. Dense: the weights and evs indexed by combo id (see combos.py),
+    NaN where the table has no row for the combo. Sparse, when ids is
+    given: the weights and evs of the rows of the sorted combo ids only.
+    """
+
+    def __init__(self, weights=None, evs=None, ids=None):
+        if weights is None:
+            weights = array('d', [math.nan]) * combos.NUM_COMBOS
+            evs = array('d', [math.nan]) * combos.NUM_COMBOS
+        self.ids = ids
+        self.weights = weights
+        self.evs = evs
+        # Rows whose combo is not written in canonical order, by string
+        self.extra = {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Builds the arrays from (combo, weight, ev) rows, the first row of a
+        combo wins. Sparse unless the table holds most combos, as in export_pack.
+        """
+        rows = list(rows)
+        ids = combos.encode_many([row[0] for row in rows], canonical=True).tolist()
+        extra = {}
+        id_rows = {}
+        for i, (combo, weight, ev) in zip(ids, rows):
+            if i < 0:
+                extra.setdefault(combo, (weight, ev))
+            elif i not in id_rows:
+                id_rows[i] = (weight, ev)
+        if len(id_rows) * SPARSE_ROW_SIZE > combos.NUM_COMBOS * DENSE_ROW_SIZE:
+            table = cls()
+            for i, (weight, ev) in id_rows.items():
+                table.weights[i] = weight
+                table.evs[i] = ev
+        else:
+            ids = array('i', sorted(id_rows))
+            table = cls(array('d', [id_rows[i][0] for i in ids]),
+                        array('d', [id_rows[i][1] for i in ids]), ids)
+        table.extra = extra
+        return table
+
+    def get(self, combo, default=None):
+        """(weight, ev) of combo, same lookup as an exact match on the combo column"""
+        i = combos.canonical_combo_id(combo)
+        if i < 0:
+            return self.extra.get(combo, default)
+        if self.ids is not None:
+            position = bisect_left(self.ids, i)
+            if position == len(self.ids) or self.ids[position] != i:
+                return default
+            return self.weights[position], self.evs[position]
+        weight = self.weights[i]
+        if math.isnan(weight):
+            return default
+        return weight, self.evs[i]
+
+    @property
+    def nbytes(self):
+        size = (self.weights.itemsize * len(self.weights) +
+                self.evs.itemsize * len(self.evs) + estimate_size(self.extra))
+        if self.ids is not None:
+            size += self.ids.itemsize * len(self.ids)
+        return size
+
+
+def table_size(table):
+    """Bytes held by a TableArrays, or by the plain dict used for a missing table"""
+    if isinstance(table, TableArrays):
+        return table.nbytes
+    return estimate_size(table)
+
+
+class NodeCache(object):
+    """
+    Whole solver nodes kept in memory. The first lookup at a node loads
+    all rows of all its child tables through load_table(dbname, table),
+    every later lookup at that node is served from the arrays.
+    load_table returns a TableArrays, or any mapping with the same get().
+    Nodes are evicted least recently used first once max_bytes is hit.
+    A node found larger than max_bytes is never loaded again, lookups at
+    it fetch the rows of their combos only through
+    fetch_rows(dbname, tables, combos).
+    """
+
+    def __init__(self, load_table, fetch_rows, max_bytes=None):
+        self.load_table = load_table
+        self.fetch_rows = fetch_rows
+        self.nodes = LRUCache(max_bytes=max_bytes, on_evict=self._evicted)
+        self.lock = threading.Lock()
+        self.loading = dict()
+        self.node_stats = dict()
+
+    def _stats(self, key):
+        stats = self.node_stats.get(key)
+        if stats is None:
+            stats = self.node_stats[key] = {
+                "hits": 0, "loads": 0, "evictions": 0, "fetches": 0, "bytes": 0}
+        return stats
+
+    def _evicted(self, key, tables):
+        with self.lock:
+            self._stats(key)["evictions"] += 1
+
+    def too_large(self, key):
+        """Whether the node of key was found larger than the whole cache when it was loaded"""
+        max_bytes = self.nodes.max_bytes
+        with self.lock:
+            stats = self.node_stats.get(key)
+            return max_bytes is not None and stats is not None and stats["bytes"] > max_bytes
+
+    def get_node(self, dbname, node, tables, combos):
+        """
+        Returns table -> TableArrays for the child tables of node, loading
+        them on first use, or table -> rows of combos for a node too large
+        to be cached
+        """
+        key = (dbname, node)
+        node_tables = self.nodes.get(key)
+        if node_tables is None and self.too_large(key):
+            with self.lock:
+                self._stats(key)["fetches"] += 1
+            return self.fetch_rows(dbname, tables, combos)
+        if node_tables is None:
+            with self.lock:
+                node_lock = self.loading.setdefault(key, threading.Lock())
+            # One thread loads a node while the others asking for it wait
+            with node_lock:
+                # Loaded by another thread while this one waited
+                node_tables = self.nodes.peek(key)
+                if node_tables is None:
+                    node_tables = {table: self.load_table(dbname, table)
+                                   for table in tables}
+                    size = sum(table_size(table) for table in node_tables.values())
+                    self.nodes.put(key, node_tables, size=size)
+                    with self.lock:
+                        stats = self._stats(key)
+                        stats["loads"] += 1
+                        stats["bytes"] = size
+                        self.loading.pop(key, None)
+                    return node_tables
+        with self.lock:
+            self._stats(key)["hits"] += 1
+        return node_tables
+
+    def preload(self, dbname, node, tables, max_bytes=None):
+        """
+        Loads node for warm up, keeping it only if it fits in max_bytes.
+        Returns the bytes the node takes, None if it did not fit.
+        """
+        key = (dbname, node)
+        if key in self.nodes:
+            with self.lock:
+                return self._stats(key)["bytes"]
+        node_tables = {table: self.load_table(dbname, table) for table in tables}
+        size = sum(table_size(table) for table in node_tables.values())
+        if max_bytes is not None and size > max_bytes:
+            return None
+        self.nodes.put(key, node_tables, size=size)
+        with self.lock:
+            stats = self._stats(key)
+            stats["loads"] += 1
+            stats["bytes"] = size
+        return size
+
+    def has_node(self, dbname, node):
+        return (dbname, node) in self.nodes
+
+    def clear(self):
+        self.nodes.clear()
+
+    def stats(self, top=10):
+        """Overall cache stats plus the top nodes by hits"""
+        with self.lock:
+            nodes = sorted(self.node_stats.items(),
+                           key=lambda item: item[1]["hits"], reverse=True)
+            stats = self.nodes.stats()
+            stats["nodes"] = [dict(node="{}:{}".format(*key), **value)
+                              for key, value in nodes[:top]]
+        return stats
@@ -0,0 +1,114 @@
+import itertools
+import threading
+import numpy as np
+from . import combos
+from .lru_cache import LRUCache
+
+
+def table_vectors(table):
+    """
+    (weights, evs) of a TableArrays as float64 arrays indexed by combo id,
+    all NaN for a table that does not exist. Rows whose combo is not
+    written in canonical order have no combo id and are left out.
+    """
+    if not hasattr(table, "weights"):
+        missing = np.full(combos.NUM_COMBOS, np.nan)
+        return missing, missing
+    if table.ids is None:
+        return (np.asarray(table.weights, dtype=np.float64),
+                np.asarray(table.evs, dtype=np.float64))
+    ids = np.asarray(table.ids, dtype=np.int64)
+    weights = np.full(combos.NUM_COMBOS, np.nan)
+    evs = np.full(combos.NUM_COMBOS, np.nan)
+    weights[ids] = np.asarray(table.weights, dtype=np.float64)
+    evs[ids] = np.asarray(table.evs, dtype=np.float64)
+    return weights, evs
+
+
+def suit_permutation(suit_map):
+    """
+    Combo id array mapping every combo to its combo id once its suits
+    are changed by suit_map, as Helper.remap_cards changes a hand: the
+    changed cards are sorted back into canonical order.
+    """
+    binomial = np.array(combos.BINOMIAL, dtype=np.int64)
+    hands = np.array(list(itertools.combinations(range(combos.NUM_CARDS), combos.HAND_SIZE)))
+    moved = np.array([combos.CARD_POSITION[card[0] + suit_map[card[1]]]
+                      for card in combos.CARDS])[hands]
+    moved.sort(axis=1)
+    ids = np.zeros(combos.NUM_COMBOS, dtype=np.int64)
+    moved_ids = np.zeros(combos.NUM_COMBOS, dtype=np.int64)
+    for j in range(combos.HAND_SIZE):
+        ids += binomial[hands[:, j], j + 1]
+        moved_ids += binomial[moved[:, j], j + 1]
+    permutation = np.empty(combos.NUM_COMBOS, dtype=np.int64)
+    permutation[ids] = moved_ids
+    return permutation
+
+
+class NodeRanges(object):
+    """
+    Solver strategies of whole nodes as arrays, for range queries.
+
+    get(dbname, node, next_tables) returns move -> {"weight", "ev"} arrays
+    of every combo, indexed by combo id, with the weights normalised over
+    the moves the way build_strategy normalises a single combo. NaN means
+    the solver has no row for the combo. Each child table is read whole
+    with one load_table(dbname, table) call, nodes are kept least
+    recently used first up to max_bytes. The arrays are shared, callers
+    must not write to them.
+    """
+
+    def __init__(self, load_table, reverse_mapping, max_bytes=None):
+        self.load_table = load_table
+        self.reverse_mapping = reverse_mapping
+        self.nodes = LRUCache(max_bytes=max_bytes)
+        self.permutations = dict()
+        self.lock = threading.Lock()
+
+    def get(self, dbname, node, next_tables):
+        key = (dbname, node)
+        strategy = self.nodes.get(key)
+        if strategy is None:
+            strategy = self.build(dbname, next_tables)
+            self.nodes.put(key, strategy, size=sum(
+                values["weight"].nbytes + values["ev"].nbytes
+                for values in strategy.values()))
+        return strategy
+
+    def has_node(self, dbname, node):
+        return (dbname, node) in self.nodes
+
+    def build(self, dbname, next_tables):
+        weights = {}
+        evs = {}
+        for move, table in next_tables.items():
+            full_move = self.reverse_mapping(move)
+            weights[full_move], evs[full_move] = table_vectors(
+                self.load_table(dbname, table))
+        if not len(weights):
+            return {}
+        stacked = np.vstack(list(weights.values()))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            totals = np.nansum(stacked, axis=0)
+            totals[np.isnan(stacked).all(axis=0)] = np.nan
+            stacked /= totals
+        return {move: {"weight": stacked[i], "ev": evs[move]}
+                for i, move in enumerate(weights)}
+
+    def remap(self, strategy, suit_map):
+        """The strategy of a stored flop seen from a flop with the same ranks, suits changed by suit_map"""
+        key = tuple(sorted(suit_map.items()))
+        with self.lock:
+            permutation = self.permutations.get(key)
+            if permutation is None:
+                permutation = self.permutations[key] = suit_permutation(suit_map)
+        return {move: {"weight": values["weight"][permutation],
+                       "ev": values["ev"][permutation]}
+                for move, values in strategy.items()}
+
+    def clear(self):
+        self.nodes.clear()
+
+    def stats(self):
+        return self.nodes.stats()
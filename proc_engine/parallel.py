@@ -0,0 +1,114 @@
+import itertools
+from collections import deque
+
+
+# How pool workers are started
+START_METHOD = "forkserver"
+
+# The parser of a worker process, its Helper built on the first chunk
+_worker = {}
+
+
+def _init_worker(parser_class, parser_kwargs, helper_kwargs):
+    _worker.update(parser_class=parser_class, parser_kwargs=parser_kwargs,
+                   helper_kwargs=helper_kwargs, parser=None)
+
+
+def get_worker_parser():
+    """The parser of this worker process, built with its own Helper on first use"""
+    if _worker["parser"] is None:
+        from .helper_functions import Helper
+        helper = Helper(**_worker["helper_kwargs"])
+        _worker["parser"] = _worker["parser_class"](
+            helper=helper, **_worker["parser_kwargs"])
+    return _worker["parser"]
+
+
+def _process_chunk(chunk):
+    parser = get_worker_parser()
+    try:
+        return parser.process_chunk(chunk)
+    finally:
+        # Pool workers leave with os._exit, past the atexit flush
+        if parser.helper.access_stats is not None:
+            parser.helper.access_stats.flush()
+
+
+def chunked(segments, chunk_size):
+    """Splits segments into lists of (index, segment) of chunk_size hands"""
+    chunk = []
+    for i, segment in enumerate(segments):
+        chunk.append((i, segment))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk):
+        yield chunk
+
+
+def process_in_pool(parser_class, segments, processes, chunk_size,
+                    parser_kwargs=None, helper_kwargs=None):
+    """
+    Runs parser_class.process_chunk over chunks of segments in a pool of
+    processes, yielding the (index, outcome) of every hand in hand order.
+    Every worker builds its own parser with parser_kwargs and, on its
+    first chunk, its own Helper with helper_kwargs. Pass
+    helper_kwargs={"shared_data": manifest} to have the workers read the
+    moves trees and categories of a SharedData published before the call.
+    segments may be a generator, at most two chunks per process are read
+    ahead of the one being yielded.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    # The parent runs lookup, event loop and pymongo threads by now, a fork
+    # of it could deadlock. Workers build their own Helper and inherit nothing.
+    with ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context(START_METHOD),
+            initializer=_init_worker,
+            initargs=(parser_class, parser_kwargs or {}, helper_kwargs or {})) as pool:
+        pending = deque()
+        for chunk in chunked(segments, chunk_size):
+            pending.append(pool.submit(_process_chunk, chunk))
+            if len(pending) > 2 * processes:
+                for outcome in pending.popleft().result():
+                    yield outcome
+        while len(pending):
+            for outcome in pending.popleft().result():
+                yield outcome
+
+
+def _run_shared(parser, segments, parser_kwargs):
+    from .shared_data import SharedData
+    # The trees of the games in the first chunk, a file rarely changes
+    # game and a worker loads any other tree it needs itself
+    segments = iter(segments)
+    first_chunk = list(itertools.islice(segments, parser.chunk_size))
+    shared = SharedData.publish(parser.helper, parser.get_dbnames(first_chunk))
+    try:
+        for outcome in process_in_pool(
+                type(parser), itertools.chain(first_chunk, segments),
+                parser.processes, parser.chunk_size,
+                parser_kwargs=parser_kwargs,
+                helper_kwargs=dict(parser.helper_kwargs, shared_data=shared.manifest)):
+            yield outcome
+    finally:
+        shared.close()
+
+
+def run_chunks(parser, segments, parser_kwargs=None):
+    """
+    (index, outcome) of every hand of segments in hand order, chunk by
+    chunk of parser.chunk_size hands through parser.process_chunk, in a
+    process pool when parser.processes is above 1. With
+    parser.share_data the pool reads the categories of parser.helper and
+    the moves trees of the games of the first chunk (parser.get_dbnames)
+    from a SharedData published for the run.
+    """
+    if parser.processes > 1:
+        if parser.share_data:
+            return _run_shared(parser, segments, parser_kwargs)
+        return process_in_pool(
+            type(parser), segments, parser.processes, parser.chunk_size,
+            parser_kwargs=parser_kwargs, helper_kwargs=parser.helper_kwargs)
+    return (outcome for chunk in chunked(segments, parser.chunk_size)
+            for outcome in parser.process_chunk(chunk))
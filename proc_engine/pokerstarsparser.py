@@ -1,9 +1,10 @@
 from .helper_functions import Helper
 import os
 import re
-import pandas as pd
 import time
 from . import __base__
+from .scoring import result_moves, score_decisions
+from .parallel import run_chunks
 
 
 class PokerStarsParser():
@@ -13,6 +14,15 @@ class PokerStarsParser():
         self.helper = kwargs.get("helper")
         self.config = __base__.configdict
         self.rake = kwargs.get("rake", 500)
+        # Hands of a file are spread over this many processes when above 1
+        self.processes = kwargs.get(
+            "processes", self.config.get("PARALLEL_PROCESSES", 1))
+        self.chunk_size = kwargs.get(
+            "chunk_size", self.config.get("PARALLEL_CHUNK_SIZE", 500))
+        # Workers read the moves trees and categories of self.helper from shared memory
+        self.share_data = kwargs.get(
+            "share_data", self.config.get("PARALLEL_SHARE_DATA", True))
+        self.helper_kwargs = kwargs.get("helper_kwargs", {})
         # Regexes
         self.cards_regex = re.compile(r'[2-9TKQJA][cdhs]', flags=re.IGNORECASE)
         self.bb_regex = re.compile(r'\/\$\d+')
@@ -33,6 +43,10 @@ class PokerStarsParser():
         self.correct_terms = ["Correct", "EV Loss"]
         self.heroname = kwargs.get("heroname", None)
         self.positions = ["EP", "MP", "CO", "BU", "SB", "BB"]
+        self.report_columns = [
+            "ID", "Hero Name", "Hand", "Pairedness", "Suitedness", "Hand Category",
+            "Position", "Result", "Opportunity", "Stack Size", "Big Blind",
+            "Player's Move", "GTO Move", "Amount Won in Terms of BB", "Move EV", "GTO EV"]
 
     def get_cards(self, line):
         cards = self.cards_regex.findall(line)
@@ -197,7 +211,11 @@ class PokerStarsParser():
         else:
             return "Other"
 
-    def process_section(self, list_of_lines):
+    def get_section_decisions(self, list_of_lines):
+        """
+        Parses a hand up to the solver lookups. Returns one entry per hero
+        decision holding the row context and the run_everything arguments.
+        """
         title, seat_lines, action_lines = self.dissect_section(list_of_lines)
         bigblind = self.find_bb(title)
         if bigblind == 0:
@@ -215,85 +233,161 @@ class PokerStarsParser():
         if category is None:
             category = {}
         amount_won = self.get_amount_won(action_lines)
-        return_values = []
+        decisions = []
         for action_sequence in action_sequences:
             opportunity = self.get_strategy_from_moves(action_sequence)
             current_action = self.move_regex.findall(action_sequence[-1])
             action_sequence[-1] = "hero"
-            res_dict = self.helper.run_everything(cards, " ".join(
-                action_sequence), stacksize, self.rake, num_players)
-            if res_dict is None:
-                continue
-            best_action = None
-            highest_ev = max([res_dict[key]["ev"] for key in res_dict])
-            for key, val in res_dict.items():
-                if highest_ev - val["ev"] < 0.0001:
-                    best_action = key
-            if current_action[0] == best_action:
-                correct = self.correct_terms[0]
-            else:
-                correct = self.correct_terms[1]
-            move_ev = res_dict.get(
-                current_action[0], {}).get("ev", None)
-            if move_ev is not None:
-                move_ev = move_ev/2000
-            return_values.append({
-                "ID": gameid,
-                "Hero Name": self.heroname,
-                "Hand": cards,
-                "Pairedness": category.get("pairing", ""),
-                "Suitedness": category.get("suiting", ""),
-                "Hand Category": category.get("category", ""),
-                "Position": player_position,
-                "Result": correct,
-                "Opportunity": opportunity,
-                "Stack Size": stacksize/bigblind,
-                "Big Blind": "{}/{}".format(int(bigblind/2), int(bigblind)),
-                "Player's Move": current_action[0],
-                "GTO Move": best_action,
-                "Amount Won in Terms of BB": amount_won/bigblind,
-                "Move EV": move_ev,
-                "GTO EV": highest_ev
+            decisions.append({
+                "lookup": (cards, " ".join(action_sequence), stacksize, self.rake, num_players),
+                "current_action": current_action,
+                "gameid": gameid,
+                "heroname": self.heroname,
+                "cards": cards,
+                "category": category,
+                "position": player_position,
+                "opportunity": opportunity,
+                "stacksize": stacksize,
+                "bigblind": bigblind,
+                "amount_won": amount_won
             })
-        return return_values
+        return decisions
+
+    def extract_decision(self, decision, res_dict):
+        """
+        Report fields of a decision and the (move, ev) pairs of its solver
+        lookup, for score_decisions. None if the lookup found no node.
+        """
+        if res_dict is None:
+            return None
+        moves = result_moves(res_dict)
+        category = decision["category"]
+        return {
+            "ID": decision["gameid"],
+            "Hero Name": decision["heroname"],
+            "Hand": decision["cards"],
+            "Pairedness": category.get("pairing", ""),
+            "Suitedness": category.get("suiting", ""),
+            "Hand Category": category.get("category", ""),
+            "Position": decision["position"],
+            "Opportunity": decision["opportunity"],
+            "Player's Move": decision["current_action"][0],
+            "stacksize": decision["stacksize"],
+            "bigblind": decision["bigblind"],
+            "amount_won": decision["amount_won"]
+        }, moves
+
+    def extract_section(self, decisions, results):
+        """Extracts all decisions of a hand, raising the first lookup error"""
+        extracted = []
+        for decision, res_dict in zip(decisions, results):
+            if isinstance(res_dict, Exception):
+                raise res_dict
+            row = self.extract_decision(decision, res_dict)
+            if row is not None:
+                extracted.append(row)
+        return extracted
+
+    def score_extracted(self, extracted):
+        """Scores extracted decisions into the report DataFrame"""
+        return score_decisions(
+            [row for row, moves in extracted], [moves for row, moves in extracted],
+            self.correct_terms, self.report_columns)
+
+    def process_section(self, list_of_lines):
+        decisions = self.get_section_decisions(list_of_lines)
+        results = self.helper.run_many(
+            [decision["lookup"] for decision in decisions])
+        return self.score_extracted(
+            self.extract_section(decisions, results)).to_dict("records")
 
     def process_file(self, filename):
+        """Segments of the file, one hand at a time, see iter_segments"""
         if os.path.isfile(filename):
-            with open(filename, 'r') as f:
-                file_lines = f.readlines()
+            return self.iter_segments(filename)
+        else:
+            raise FileNotFoundError("file not found: {}".format(filename))
 
+    def iter_segments(self, filename):
+        """
+        Yields the hands of the file as lists of lines, reading it as they
+        are consumed. A hand ends at a blank line that is not the last line
+        of the file, the lines after the last such blank line are not a hand.
+        """
+        with open(filename, 'r') as f:
             current_segment = []
-            segments = []
-            file_len = len(file_lines)
-            for i, line in enumerate(file_lines):
-                if i < file_len - 1 and (file_lines[i] == '\n'):
+            # A blank line only ends a hand once another line follows it
+            blank_line = False
+            for line in f:
+                if blank_line:
                     if len(current_segment):
-                        segments.append(current_segment)
+                        yield current_segment
                     current_segment = []
+                    blank_line = False
+                if line == '\n':
+                    blank_line = True
                     continue
                 current_segment.append(line)
-            return segments
-        else:
-            raise FileNotFoundError("file not found: {}".format(filename))
+
+    def get_dbnames(self, segments):
+        """dbnames the lookups of segments go to, hands that fail to parse are left out"""
+        dbnames = set()
+        for segment in segments:
+            try:
+                decisions = self.get_section_decisions(segment)
+            except Exception:
+                continue
+            for decision in decisions:
+                dbnames.add(self.helper.get_dbname(*decision["lookup"][2:]))
+        return sorted(dbnames)
+
+    def process_chunk(self, chunk):
+        """
+        Runs the hands of chunk, a list of (index, segment), up to scoring
+        with one run_many for all of their lookups. Returns the (index,
+        extracted decisions) of every hand, the error message instead of
+        the decisions for a hand that failed.
+        """
+        outcomes = {}
+        sections = []
+        for i, segment in chunk:
+            try:
+                sections.append((i, self.get_section_decisions(segment)))
+            except Exception as e:
+                outcomes[i] = "Error in iteration {}: {}".format(i, e)
+        try:
+            results = self.helper.run_many(
+                [decision["lookup"] for i, decisions in sections for decision in decisions])
+        except Exception as e:
+            for i, decisions in sections:
+                outcomes[i] = "Error in iteration {}: {}".format(i, e)
+            return [(i, outcomes[i]) for i, segment in chunk]
+        position = 0
+        for i, decisions in sections:
+            section_results = results[position:position + len(decisions)]
+            position += len(decisions)
+            try:
+                outcomes[i] = self.extract_section(decisions, section_results)
+            except Exception as e:
+                outcomes[i] = "Error in iteration {}: {}".format(i, e)
+        return [(i, outcomes[i]) for i, segment in chunk]
 
     def run_everything(self, filename):
         print("Starting")
         segments = self.process_file(filename)
         overall_vals = []
         start_time = time.time()
-        len_segments = len(segments)
-        for i, segment in enumerate(segments):
-            try:
-                # print("\rDone: {} out of {}".format(i, len_segments), end=" ")
-                ret_vals = self.process_section(segment)
-                for ret_val in ret_vals:
-                    overall_vals.append(ret_val)
-            except Exception as e:
-                print("Error in iteration {}: {}".format(i, e))
+        len_segments = 0
+        for i, outcome in run_chunks(self, segments, parser_kwargs={"rake": self.rake}):
+            len_segments += 1
+            if isinstance(outcome, str):
+                print(outcome)
+            else:
+                overall_vals.extend(outcome)
         end_time = time.time()
-        df = pd.DataFrame(overall_vals)
+        df = self.score_extracted(overall_vals)
         print("Time taken: {:.2f}min for {} hands".format(
-            (end_time-start_time)/60, len(segments)))
+            (end_time-start_time)/60, len_segments))
         return df, len_segments
 
 
@@ -0,0 +1,58 @@
+import re
+from .lru_cache import LRUCache
+
+
+# $n parameter of a statement
+PARAMETER_REGEX = re.compile(r"\$(\d+)")
+
+
+def quote_table(table):
+    """Quotes a solver table name for use as an SQL identifier"""
+    return '"{}"'.format(table.replace('"', '""'))
+
+
+class PreparedStatementCache(object):
+    """
+    Server side prepared statements of one Postgres connection.
+
+    Statements are prepared on first use of their key and reused for the
+    life of the connection. The number kept is bounded, the least recently
+    used one is deallocated on the server when the limit is hit. With a
+    limit of 0 nothing is prepared, every query runs on its own.
+    """
+
+    def __init__(self, conn, max_statements=None):
+        self.conn = conn
+        self.counter = 0
+        self.statements = LRUCache(
+            max_entries=max_statements, on_evict=self._deallocate)
+
+    def _deallocate(self, key, name):
+        with self.conn.cursor() as cursor:
+            cursor.execute("DEALLOCATE {};".format(name))
+
+    def execute(self, cursor, key, query, params, types):
+        """
+        Executes query, prepared under key, with params bound to $1..$n.
+        types is the list of Postgres types of the parameters.
+        """
+        if not self.statements.enabled:
+            self.execute_unprepared(cursor, query, params, types)
+            return None
+        name = self.statements.get(key)
+        if name is None:
+            self.counter += 1
+            name = "lookup_{}".format(self.counter)
+            cursor.execute("PREPARE {} ({}) AS {};".format(
+                name, ", ".join(types), query))
+            self.statements.put(key, name, size=1)
+        cursor.execute("EXECUTE {} ({});".format(
+            name, ", ".join(["%s"] * len(params))), params)
+        return name
+
+    def execute_unprepared(self, cursor, query, params, types):
+        """execute without a prepared statement, $n bound by psycopg2 and cast to its type"""
+        query = PARAMETER_REGEX.sub(
+            lambda match: "%(p{0})s::{1}".format(match.group(1), types[int(match.group(1)) - 1]),
+            query.replace("%", "%%"))
+        cursor.execute(query, {"p{}".format(i + 1): param for i, param in enumerate(params)})
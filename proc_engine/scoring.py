@@ -0,0 +1,58 @@
+# A move whose EV is this close to the highest one counts as best,
+# the last such move of a result is the GTO move
+EV_TOLERANCE = 0.0001
+# Move EV is reported in these units of the solver's EV
+EV_SCALE = 2000
+
+
+def result_moves(res_dict):
+    """(move, ev) pairs of a solver result, raising on a result that has none as scoring one decision at a time did"""
+    if not len(res_dict):
+        # A decision with no moves would break the reduceat of the whole file
+        raise ValueError("Solver result has no moves")
+    return [(key, res_dict[key]["ev"]) for key in res_dict]
+
+
+def score_decisions(rows, moves, correct_terms, columns):
+    """
+    Scores every decision of a file with column operations.
+
+    rows holds one dict per decision with its report fields (including
+    "Player's Move") and the raw "bigblind", "amount_won" and, when the
+    report has a "Stack Size", "stacksize". moves holds the (move, ev)
+    pairs of each decision's solver result. Returns the report as a
+    DataFrame with the given columns.
+    """
+    import numpy as np
+    import pandas as pd
+    if not len(rows):
+        return pd.DataFrame()
+    df = pd.DataFrame(rows)
+    counts = np.fromiter((len(pairs) for pairs in moves), dtype=np.int64, count=len(moves))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    decision_ids = np.repeat(np.arange(len(moves)), counts)
+    names = np.array([move for pairs in moves for move, ev in pairs], dtype=object)
+    evs = np.array([ev for pairs in moves for move, ev in pairs], dtype=np.float64)
+
+    highest_ev = np.maximum.reduceat(evs, starts)
+    candidates = np.where(highest_ev[decision_ids] - evs < EV_TOLERANCE,
+                          np.arange(len(evs)), -1)
+    best_action = names[np.maximum.reduceat(candidates, starts)]
+
+    players_move = df["Player's Move"].to_numpy(dtype=object)
+    played = names == players_move[decision_ids]
+    move_ev = np.full(len(moves), np.nan)
+    move_ev[decision_ids[played]] = evs[played] / EV_SCALE
+
+    bigblind = df["bigblind"]
+    df["Result"] = np.where(players_move == best_action,
+                            correct_terms[0], correct_terms[1])
+    if "Stack Size" in columns:
+        df["Stack Size"] = df["stacksize"] / bigblind
+    df["Big Blind"] = ((bigblind / 2).astype(int).astype(str) + "/" +
+                       bigblind.astype(int).astype(str))
+    df["GTO Move"] = best_action
+    df["Amount Won in Terms of BB"] = df["amount_won"] / bigblind
+    df["Move EV"] = move_ev
+    df["GTO EV"] = highest_ev
+    return df[columns]
@@ -0,0 +1,115 @@
+from array import array
+from multiprocessing import shared_memory
+from .moves_tree import MovesTree, ARRAYS
+from .categories import CategoryTable, FIELDS
+
+
+def _attach_block(name):
+    """Attaches to an existing block without handing its cleanup to this process"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 every attach registers the block with the
+        # resource tracker. Workers started by multiprocessing after the
+        # block was published share the parent's tracker, which already
+        # has it and only unlinks it if the parent dies without close().
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedData(object):
+    """
+    The read only data of a Helper (compiled moves trees and the category
+    table) copied once into a multiprocessing.shared_memory block.
+
+    The parent process calls SharedData.publish(helper, dbnames) and hands
+    .manifest (a small picklable dict) to the workers it starts afterwards,
+    which build their Helper with Helper(shared_data=manifest). The
+    workers' moves trees and category table are then memoryviews over the
+    one shared block. The parent unlinks the block with close() once the
+    workers are done. parallel.run_chunks does all of this for a parser
+    with share_data set.
+    """
+
+    def __init__(self, shm, manifest, owner=False):
+        self.shm = shm
+        self.manifest = manifest
+        self.owner = owner
+
+    @classmethod
+    def publish(cls, helper, dbnames=None):
+        """Loads the moves trees of dbnames (all of helper.dbs by default) and the category table into a new block"""
+        if dbnames is None:
+            dbnames = helper.dbs
+        arrays = []
+        manifest = {"trees": {}}
+        offset = 0
+
+        def place(data):
+            nonlocal offset
+            offset += -offset % 8
+            arrays.append((offset, data))
+            typecode = data.format if isinstance(data, memoryview) else data.typecode
+            entry = (offset, typecode, len(data))
+            offset += data.itemsize * len(data)
+            return entry
+
+        for dbname in dbnames:
+            tree = helper.get_moves_tree(dbname)
+            manifest["trees"][dbname] = {
+                "moves": list(tree.moves),
+                "kinds": place(tree.kinds),
+                "child_offsets": place(tree.child_offsets),
+                "child_moves": place(tree.child_moves),
+                "child_nodes": place(tree.child_nodes),
+            }
+        table = helper.category_table
+        manifest["categories"] = {
+            "strings": list(table.strings[1:]),
+            "columns": {field: place(table.columns[field]) for field in FIELDS},
+        }
+
+        shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for start, data in arrays:
+            raw = memoryview(data).cast('B')
+            shm.buf[start:start + len(raw)] = raw
+        manifest["name"] = shm.name
+        return cls(shm, manifest, owner=True)
+
+    @classmethod
+    def attach(cls, manifest):
+        return cls(_attach_block(manifest["name"]), manifest)
+
+    def _view(self, entry):
+        start, typecode, length = entry
+        itemsize = array(typecode).itemsize
+        return self.shm.buf[start:start + itemsize * length].cast(typecode)
+
+    def moves_tree(self, dbname):
+        """A MovesTree over the shared arrays of dbname"""
+        entry = self.manifest["trees"][dbname]
+        return MovesTree.from_arrays(entry["moves"], *[
+            self._view(entry[name]) for name in ARRAYS])
+
+    def category_table(self):
+        """A CategoryTable over the shared columns"""
+        entry = self.manifest["categories"]
+        table = CategoryTable()
+        for value in entry["strings"]:
+            table._string_code(value)
+        table.columns = {field: self._view(entry["columns"][field])
+                         for field in FIELDS}
+        return table
+
+    def install(self, helper):
+        """Points helper at the shared moves trees and category table"""
+        with helper.lock:
+            for dbname in self.manifest["trees"]:
+                helper.moves_trees[dbname] = self.moves_tree(dbname)
+            helper._category_table = self.category_table()
+        helper.shared_data = self
+
+    def close(self):
+        """Unlinks the block if this process published it"""
+        if self.owner:
+            self.shm.close()
+            self.shm.unlink()
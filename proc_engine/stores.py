@@ -0,0 +1,548 @@
+import os
+import abc
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from . import combos
+from .categories import CategoryTable, FIELDS
+from .strategy_pack import StrategyPack
+from .node_cache import TableArrays
+from .prepared_statements import PreparedStatementCache, quote_table
+from .best_actions import BEST_ACTION_TABLE
+from .consolidate import NODES_TABLE, ROWS_TABLE, NON_SOLVER_TABLES, solver_table_names
+
+
+class StrategyStore(abc.ABC):
+    """
+    Where Helper reads solver data from: the moves tree document of each
+    dbname, the rows of its solver tables and the card_ranges categories.
+    Table rows are (combo, weight, ev), the first row of a combo wins.
+    """
+
+    # True for stores that fetch several tables in one query
+    batches_tables = False
+    # Stores that can serve the table built by best_actions.py set this and
+    # implement fetch_best_actions(dbname, node, combos)
+    has_best_actions = False
+
+    @abc.abstractmethod
+    def get_moves_document(self, dbname):
+        """The moves tree document of dbname, or None"""
+
+    @abc.abstractmethod
+    def get_table_names(self, dbname):
+        """Names of the solver tables of dbname"""
+
+    @abc.abstractmethod
+    def fetch_table_rows(self, dbname, table, combos):
+        """Rows of combos in one solver table as a dict of combo -> (weight, ev)"""
+
+    def fetch_tables_rows(self, dbname, tables, combos):
+        """Rows of combos in each of tables, as table -> combo -> (weight, ev)"""
+        return {table: self.fetch_table_rows(dbname, table, combos) for table in tables}
+
+    @abc.abstractmethod
+    def iter_table_rows(self, dbname, table):
+        """Every row of one solver table as (combo, weight, ev)"""
+
+    def load_table_arrays(self, dbname, table):
+        """Every row of one solver table as a TableArrays"""
+        return TableArrays.from_rows(self.iter_table_rows(dbname, table))
+
+    @abc.abstractmethod
+    def get_category_table(self):
+        """The card_ranges categories as a CategoryTable"""
+
+    @abc.abstractmethod
+    def get_version(self, dbname):
+        """Stamp of the solver data of dbname, changes whenever it is reloaded"""
+
+    def close(self):
+        pass
+
+
+class PostgresMongoStore(StrategyStore):
+    """
+    Solver tables in one Postgres database per dbname, moves trees and
+    categories in Mongo. Each dbname gets a pool of pool_size connections,
+    opened on its first use and kept open until close().
+    """
+
+    has_best_actions = True
+    # Tables get_version covers: the solver tables, not the ones derived
+    # from them, which can be rebuilt without changing any strategy
+    version_condition = "NOT c.relname = ANY(%s)", list(NON_SOLVER_TABLES)
+
+    def __init__(self, configdict, pool_size=8, max_prepared_statements=256):
+        self.configdict = configdict
+        self.pool_size = pool_size
+        self.max_prepared_statements = max_prepared_statements
+        self.pools = dict()
+        self.pool_slots = dict()
+        self.statement_caches = dict()
+        self._mongoconn = None
+        self.lock = threading.RLock()
+
+    @property
+    def mongoconn(self):
+        with self.lock:
+            if self._mongoconn is None:
+                import pymongo
+                self._mongoconn = pymongo.MongoClient("mongodb://{}:{}@{}:{}".format(
+                    self.configdict.get("MONGO_USER"),
+                    self.configdict.get("MONGO_PWD"),
+                    self.configdict.get("MONGO_HOST"),
+                    self.configdict.get("MONGO_PORT")
+                ))
+        return self._mongoconn
+
+    @property
+    def category_db(self):
+        return self.mongoconn["ranges"]["card_ranges"]
+
+    def get_moves_collection(self, dbname):
+        return self.mongoconn[self.configdict.get("MOVES_DB_NAME")][dbname]
+
+    def get_pool(self, dbname):
+        """Returns the connection pool of dbname, creating it on first use"""
+        with self.lock:
+            pool = self.pools.get(dbname)
+            if pool is None:
+                from psycopg2.pool import ThreadedConnectionPool
+                try:
+                    # One connection up front, the others opened as
+                    # concurrent lookups need them
+                    pool = ThreadedConnectionPool(1, self.pool_size, "postgresql://{}:{}@{}:{}/{}".format(
+                        self.configdict.get("PG_USER"),
+                        self.configdict.get("PG_PWD"),
+                        self.configdict.get("PG_HOST"),
+                        self.configdict.get("PG_PORT"),
+                        dbname))
+                except Exception as e:
+                    print(e)
+                    logging.error("Could not connect to database {}".format(dbname))
+                    raise
+                # putconn closes a returned connection once minconn idle
+                # ones are kept, raised after the connect so that every
+                # connection opened stays open
+                pool.minconn = self.pool_size
+                self.pools[dbname] = pool
+                # getconn raises instead of waiting when the pool is empty
+                self.pool_slots[dbname] = threading.BoundedSemaphore(self.pool_size)
+        return pool
+
+    @contextmanager
+    def connection(self, dbname):
+        """Borrows a connection of dbname from its pool for the duration of the block"""
+        pool = self.get_pool(dbname)
+        slots = self.pool_slots[dbname]
+        with slots:
+            conn = pool.getconn()
+            try:
+                if not conn.autocommit:
+                    conn.autocommit = True
+                yield conn
+            finally:
+                pool.putconn(conn)
+
+    def get_statement_cache(self, conn):
+        """Prepared statements of a pooled connection"""
+        with self.lock:
+            statements = self.statement_caches.get(conn)
+            if statements is None:
+                statements = PreparedStatementCache(
+                    conn, self.max_prepared_statements)
+                self.statement_caches[conn] = statements
+        return statements
+
+    def get_moves_document(self, dbname):
+        return self.get_moves_collection(dbname).find_one()
+
+    def get_table_names(self, dbname):
+        with self.connection(dbname) as conn:
+            with conn.cursor() as cursor:
+                return solver_table_names(cursor)
+
+    def fetch_table_rows(self, dbname, table, combos):
+        """One execution of a prepared statement per call"""
+        with self.connection(dbname) as conn:
+            statements = self.get_statement_cache(conn)
+            with conn.cursor() as cursor:
+                statements.execute(
+                    cursor, table,
+                    "SELECT combo, * FROM {} WHERE combo = ANY($1)".format(
+                        quote_table(table)),
+                    (list(combos),), ["text[]"])
+                result = cursor.fetchall()
+        rows = {}
+        for res in result:
+            if res[0] not in rows:
+                rows[res[0]] = (res[2], res[3])
+        return rows
+
+    def iter_table_rows(self, dbname, table):
+        with self.connection(dbname) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT combo, * FROM {};".format(quote_table(table)))
+                result = cursor.fetchall()
+        return ((res[0], res[2], res[3]) for res in result)
+
+    def fetch_best_actions(self, dbname, node, combos):
+        """Materialised strategies of combos at node, as combo -> run_everything result"""
+        with self.connection(dbname) as conn:
+            statements = self.get_statement_cache(conn)
+            with conn.cursor() as cursor:
+                statements.execute(
+                    cursor, BEST_ACTION_TABLE,
+                    "SELECT combo, moves, weights, evs FROM {} "
+                    "WHERE node = $1 AND combo = ANY($2)".format(BEST_ACTION_TABLE),
+                    (node, list(combos)), ["text", "text[]"])
+                result = cursor.fetchall()
+        strategies = {}
+        for combo, moves, weights, evs in result:
+            strategies[combo] = {move: {"weight": weight, "ev": ev}
+                                 for move, weight, ev in zip(moves, weights, evs)}
+        return strategies
+
+    def get_category_table(self):
+        return CategoryTable.from_collection(self.category_db)
+
+    def get_version(self, dbname):
+        """
+        md5 of the storage and the row write counts of every solver table:
+        a reload or truncate changes the storage, an in place INSERT,
+        UPDATE or DELETE the counts. The counts are statistics, a reset of
+        them changes the version too. Tables of version_condition only.
+        """
+        condition, tables = self.version_condition
+        with self.connection(dbname) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT md5(string_agg(c.relname || ':' || c.relfilenode || ':' || "
+                    "s.n_tup_ins || ':' || s.n_tup_upd || ':' || s.n_tup_del, ',' "
+                    "ORDER BY c.relname)) "
+                    "FROM pg_class c JOIN pg_stat_user_tables s ON s.relid = c.oid "
+                    "WHERE c.relkind = 'r' AND c.relnamespace = 'public'::regnamespace "
+                    "AND {};".format(condition), (tables,))
+                return cursor.fetchall()[0][0]
+
+    def close(self):
+        with self.lock:
+            for pool in self.pools.values():
+                pool.closeall()
+            self.pools.clear()
+            self.pool_slots.clear()
+            self.statement_caches.clear()
+
+
+class ConsolidatedPostgresStore(PostgresMongoStore):
+    """
+    PostgresMongoStore for databases migrated by consolidate.py: the rows
+    of every solver table live in strategy_rows under the node_id that
+    solver_nodes gives the table name, so all children of a decision come
+    back from one query.
+    """
+
+    batches_tables = True
+    version_condition = "c.relname = ANY(%s)", [NODES_TABLE, ROWS_TABLE]
+
+    def __init__(self, configdict, **kwargs):
+        super().__init__(configdict, **kwargs)
+        self.node_ids = dict()
+
+    def get_node_ids(self, dbname):
+        """Table name -> node_id of dbname, loaded once"""
+        node_ids = self.node_ids.get(dbname)
+        if node_ids is None:
+            with self.connection(dbname) as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT name, node_id FROM {};".format(NODES_TABLE))
+                    node_ids = dict(cursor.fetchall())
+            self.node_ids[dbname] = node_ids
+        return node_ids
+
+    def get_table_names(self, dbname):
+        return list(self.get_node_ids(dbname))
+
+    def fetch_tables_rows(self, dbname, tables, combos):
+        node_ids = self.get_node_ids(dbname)
+        names = {node_ids[table]: table for table in tables if table in node_ids}
+        table_rows = {table: {} for table in tables}
+        if not len(names):
+            return table_rows
+        with self.connection(dbname) as conn:
+            statements = self.get_statement_cache(conn)
+            with conn.cursor() as cursor:
+                statements.execute(
+                    cursor, ROWS_TABLE,
+                    "SELECT node_id, combo, weight, ev FROM {} "
+                    "WHERE node_id = ANY($1) AND combo = ANY($2)".format(ROWS_TABLE),
+                    (list(names), list(combos)), ["integer[]", "text[]"])
+                result = cursor.fetchall()
+        for node_id, combo, weight, ev in result:
+            table_rows[names[node_id]][combo] = (weight, ev)
+        return table_rows
+
+    def fetch_table_rows(self, dbname, table, combos):
+        return self.fetch_tables_rows(dbname, [table], combos)[table]
+
+    def iter_table_rows(self, dbname, table):
+        node_id = self.get_node_ids(dbname).get(table)
+        if node_id is None:
+            return iter(())
+        with self.connection(dbname) as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(
+                    "SELECT combo, weight, ev FROM {} WHERE node_id = %s;".format(ROWS_TABLE),
+                    (node_id,))
+                return iter(cursor.fetchall())
+
+    def close(self):
+        super().close()
+        self.node_ids.clear()
+
+
+class PackStore(StrategyStore):
+    """
+    Solver tables from the mmap'd packs written by strategy_pack.py,
+    moves trees and categories from another store.
+    """
+
+    def __init__(self, pack_dir, store):
+        self.pack_dir = pack_dir
+        self.store = store
+        self.packs = dict()
+        self.lock = threading.Lock()
+
+    def get_pack(self, dbname):
+        """Opens the strategy pack of dbname on first use"""
+        with self.lock:
+            pack = self.packs.get(dbname)
+            if pack is None:
+                pack = StrategyPack(os.path.join(
+                    self.pack_dir, "{}.pack".format(dbname)))
+                self.packs[dbname] = pack
+        return pack
+
+    @property
+    def has_best_actions(self):
+        return self.store.has_best_actions
+
+    def get_moves_document(self, dbname):
+        return self.store.get_moves_document(dbname)
+
+    def get_table_names(self, dbname):
+        return list(self.get_pack(dbname).tables)
+
+    def fetch_table_rows(self, dbname, table, combos):
+        return self.get_pack(dbname).fetch_table_rows(table, combos)
+
+    def iter_table_rows(self, dbname, table):
+        return self.get_pack(dbname).iter_rows(table)
+
+    def load_table_arrays(self, dbname, table):
+        return self.get_pack(dbname).table_arrays(table)
+
+    def fetch_best_actions(self, dbname, node, combos):
+        """Only called when the wrapped store has_best_actions"""
+        return self.store.fetch_best_actions(dbname, node, combos)
+
+    def get_category_table(self):
+        return self.store.get_category_table()
+
+    def get_version(self, dbname):
+        stat = os.stat(self.get_pack(dbname).path)
+        return "{}-{}".format(stat.st_size, stat.st_mtime_ns)
+
+    def close(self):
+        with self.lock:
+            for pack in self.packs.values():
+                pack.close()
+            self.packs.clear()
+        self.store.close()
+
+
+class SQLiteStore(StrategyStore):
+    """
+    Everything in one local SQLite file written by export_sqlite, for
+    single node deployments with no database servers. Each thread reads
+    through its own connection.
+    """
+
+    # Stay under SQLITE_MAX_VARIABLE_NUMBER of older SQLite builds
+    MAX_VARIABLES = 900
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+
+    @property
+    def conn(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            import sqlite3
+            conn = sqlite3.connect("file:{}?mode=ro".format(self.path), uri=True,
+                                   check_same_thread=False)
+            self.local.conn = conn
+        return conn
+
+    def get_moves_document(self, dbname):
+        res = self.conn.execute(
+            "SELECT document FROM moves_trees WHERE dbname = ?;", (dbname,)).fetchone()
+        if res is None:
+            return None
+        return json.loads(res[0])
+
+    def get_table_names(self, dbname):
+        return [res[0] for res in self.conn.execute(
+            "SELECT tbl FROM solver_tables WHERE dbname = ?;", (dbname,))]
+
+    def fetch_table_rows(self, dbname, table, combos):
+        combos = list(combos)
+        rows = {}
+        for i in range(0, len(combos), self.MAX_VARIABLES):
+            chunk = combos[i:i + self.MAX_VARIABLES]
+            for combo, weight, ev in self.conn.execute(
+                    "SELECT combo, weight, ev FROM strategy_rows "
+                    "WHERE dbname = ? AND tbl = ? AND combo IN ({});".format(
+                        ", ".join(["?"] * len(chunk))),
+                    [dbname, table] + chunk):
+                rows[combo] = (weight, ev)
+        return rows
+
+    def iter_table_rows(self, dbname, table):
+        return self.conn.execute(
+            "SELECT combo, weight, ev FROM strategy_rows WHERE dbname = ? AND tbl = ?;",
+            (dbname, table))
+
+    def get_category_table(self):
+        table = CategoryTable()
+        for res in self.conn.execute(
+                "SELECT cards, {} FROM card_ranges;".format(", ".join(FIELDS))):
+            document = {"cards": res[0]}
+            document.update(zip(FIELDS, res[1:]))
+            table.add(document)
+        return table
+
+    def get_version(self, dbname):
+        stat = os.stat(self.path)
+        return "{}-{}".format(stat.st_size, stat.st_mtime_ns)
+
+    def close(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+
+def export_sqlite(store, path, dbnames):
+    """Copies the moves trees, solver tables and categories of dbnames from store into a new SQLiteStore file"""
+    import sqlite3
+    tmp_path = "{}.tmp".format(path)
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute("CREATE TABLE moves_trees (dbname TEXT PRIMARY KEY, document TEXT NOT NULL);")
+    conn.execute("CREATE TABLE solver_tables (dbname TEXT NOT NULL, tbl TEXT NOT NULL, "
+                 "PRIMARY KEY (dbname, tbl)) WITHOUT ROWID;")
+    conn.execute("CREATE TABLE strategy_rows (dbname TEXT NOT NULL, tbl TEXT NOT NULL, "
+                 "combo TEXT NOT NULL, weight REAL NOT NULL, ev REAL NOT NULL, "
+                 "PRIMARY KEY (dbname, tbl, combo)) WITHOUT ROWID;")
+    conn.execute("CREATE TABLE card_ranges (cards TEXT PRIMARY KEY, {});".format(
+        ", ".join("{} TEXT".format(field) for field in FIELDS)))
+    for dbname in dbnames:
+        document = store.get_moves_document(dbname)
+        if document is not None:
+            document = {key: value for key, value in document.items() if key != "_id"}
+            conn.execute("INSERT INTO moves_trees VALUES (?, ?);",
+                         (dbname, json.dumps(document)))
+        for table in store.get_table_names(dbname):
+            conn.execute("INSERT INTO solver_tables VALUES (?, ?);", (dbname, table))
+            conn.executemany(
+                "INSERT OR IGNORE INTO strategy_rows VALUES (?, ?, ?, ?, ?);",
+                ((dbname, table, combo, weight, ev)
+                 for combo, weight, ev in store.iter_table_rows(dbname, table)))
+        conn.commit()
+    categories = store.get_category_table()
+    rows = []
+    for _id in range(combos.NUM_COMBOS):
+        document = categories.lookup(_id)
+        if document is not None:
+            rows.append([document["cards"]] + [document.get(field) for field in FIELDS])
+    conn.executemany("INSERT INTO card_ranges VALUES ({});".format(
+        ", ".join(["?"] * (len(FIELDS) + 1))), rows)
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, path)
+
+
+class MemoryStore(StrategyStore):
+    """Everything in plain dicts, filled with the add_* methods. For tests and benchmarks with no services"""
+
+    def __init__(self):
+        self.documents = dict()
+        self.tables = dict()
+        self.categories = CategoryTable()
+        self.revision = 0
+
+    def add_moves_tree(self, dbname, document):
+        self.documents[dbname] = document
+        self.revision += 1
+
+    def add_rows(self, dbname, table, rows):
+        """Adds (combo, weight, ev) rows to a solver table, creating it if needed"""
+        table_rows = self.tables.setdefault(dbname, dict()).setdefault(table, dict())
+        for combo, weight, ev in rows:
+            table_rows.setdefault(combo, (weight, ev))
+        self.revision += 1
+
+    def add_category(self, document):
+        self.categories.add(document)
+        self.revision += 1
+
+    def get_moves_document(self, dbname):
+        return self.documents.get(dbname)
+
+    def get_table_names(self, dbname):
+        return list(self.tables.get(dbname, {}))
+
+    def fetch_table_rows(self, dbname, table, combos):
+        table_rows = self.tables.get(dbname, {}).get(table, {})
+        rows = {}
+        for combo in combos:
+            res = table_rows.get(combo)
+            if res is not None:
+                rows[combo] = res
+        return rows
+
+    def iter_table_rows(self, dbname, table):
+        for combo, (weight, ev) in self.tables.get(dbname, {}).get(table, {}).items():
+            yield combo, weight, ev
+
+    def get_category_table(self):
+        return self.categories
+
+    def get_version(self, dbname):
+        return "memory-{}".format(self.revision)
+
+
+def make_store(name, configdict, **kwargs):
+    """Builds the store named by STRATEGY_STORE: postgres, consolidated, sqlite or memory"""
+    if name == "postgres":
+        return PostgresMongoStore(configdict, **kwargs)
+    if name == "consolidated":
+        return ConsolidatedPostgresStore(configdict, **kwargs)
+    if name == "sqlite":
+        return SQLiteStore(configdict.get("SQLITE_STORE_FILE"))
+    if name == "memory":
+        return MemoryStore()
+    raise ValueError("Unknown strategy store: {}".format(name))
+
+
+if __name__ == '__main__':
+    from .helper_functions import Helper
+    helper = Helper(store="postgres", use_pack=False)
+    path = helper.configdict.get("SQLITE_STORE_FILE")
+    export_sqlite(helper.store, path, helper.dbs)
+    print("Exported {} databases to {}".format(len(helper.dbs), path))
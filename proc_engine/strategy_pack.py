@@ -0,0 +1,176 @@
+import os
+import json
+import mmap
+import math
+import struct
+from array import array
+from bisect import bisect_left
+from . import __base__
+from . import combos
+from .consolidate import solver_table_names
+from .prepared_statements import quote_table
+
+
+MAGIC = b"GTOPACK\0"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+# Bytes per row of a sparse table (combo id, weight, ev) and per combo of a dense one
+SPARSE_ROW_SIZE = 20
+DENSE_ROW_SIZE = 16
+
+
+def _pad(f):
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+def export_pack(cursor, path):
+    """
+    Dumps every solver table reachable through cursor into a pack file.
+
+    Layout: header, the rows of every table, then a JSON directory of
+    [table, offset, row count, dense]. A table's rows are stored sparse,
+    sorted by combo id (see combos.py): an int32 combo id array then
+    float64 weight and ev arrays. A table holding most combos is stored
+    dense instead, as weight and ev arrays over every combo id with NaN
+    for the missing ones, whichever is smaller. Arrays are 8 byte aligned.
+    Rows whose combo is not written in canonical order are left out.
+    """
+    tables = solver_table_names(cursor)
+
+    tmp_path = "{}.tmp".format(path)
+    directory = []
+    with open(tmp_path, "wb") as f:
+        # The directory goes after the rows, its offset is patched into the header
+        f.write(HEADER.pack(MAGIC, VERSION, 0))
+        f.write(struct.pack("<Q", 0))
+        for table in tables:
+            cursor.execute("SELECT combo, * FROM {};".format(quote_table(table)))
+            results = cursor.fetchall()
+            ids = combos.encode_many([res[0] for res in results], canonical=True).tolist()
+            rows = {}
+            for i, res in zip(ids, results):
+                if i >= 0 and i not in rows:
+                    rows[i] = (res[2], res[3])
+            _pad(f)
+            dense = len(rows) * SPARSE_ROW_SIZE > combos.NUM_COMBOS * DENSE_ROW_SIZE
+            directory.append([table, f.tell(), len(rows), dense])
+            if dense:
+                weights = array('d', [math.nan]) * combos.NUM_COMBOS
+                evs = array('d', [math.nan]) * combos.NUM_COMBOS
+                for i, (weight, ev) in rows.items():
+                    weights[i] = weight
+                    evs[i] = ev
+                weights.tofile(f)
+                evs.tofile(f)
+                continue
+            ids = array('i', sorted(rows))
+            ids.tofile(f)
+            _pad(f)
+            array('d', [rows[i][0] for i in ids]).tofile(f)
+            array('d', [rows[i][1] for i in ids]).tofile(f)
+        directory_offset = f.tell()
+        directory = json.dumps(directory).encode()
+        f.write(directory)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(directory)))
+        f.write(struct.pack("<Q", directory_offset))
+    os.replace(tmp_path, path)
+    return len(tables)
+
+
+class StrategyPack(object):
+    """Read only, mmap backed view of a pack written by export_pack"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, directory_len = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a strategy pack: {}".format(path))
+        directory_offset = struct.unpack_from("<Q", self.mm, HEADER.size)[0]
+        directory = json.loads(
+            self.mm[directory_offset:directory_offset + directory_len].decode())
+        self.tables = {table: (offset, count, dense)
+                       for table, offset, count, dense in directory}
+        self.view = memoryview(self.mm)
+
+    def _table_views(self, table):
+        """(combo ids or None when dense, weights, evs) memoryviews of a table, or None"""
+        entry = self.tables.get(table)
+        if entry is None:
+            return None
+        offset, count, dense = entry
+        if dense:
+            size = 8 * combos.NUM_COMBOS
+            return (None, self.view[offset:offset + size].cast('d'),
+                    self.view[offset + size:offset + 2 * size].cast('d'))
+        ids = self.view[offset:offset + 4 * count].cast('i')
+        offset += 4 * count
+        offset += -offset % 8
+        weights = self.view[offset:offset + 8 * count].cast('d')
+        offset += 8 * count
+        evs = self.view[offset:offset + 8 * count].cast('d')
+        return ids, weights, evs
+
+    def fetch_table_rows(self, table, combo_strings):
+        """Same contract as Helper.fetch_table_rows: combo -> (weight, ev)"""
+        rows = {}
+        views = self._table_views(table)
+        if views is None:
+            return rows
+        ids, weights, evs = views
+        for combo in combo_strings:
+            i = combos.canonical_combo_id(combo)
+            if i < 0:
+                continue
+            if ids is None:
+                if not math.isnan(weights[i]):
+                    rows[combo] = (weights[i], evs[i])
+                continue
+            position = bisect_left(ids, i)
+            if position < len(ids) and ids[position] == i:
+                rows[combo] = (weights[position], evs[position])
+        return rows
+
+    def iter_rows(self, table):
+        """Every row of a table as (combo, weight, ev)"""
+        views = self._table_views(table)
+        if views is None:
+            return
+        for i, weight, ev in self._rows(*views):
+            yield combos.combo_from_id(i), weight, ev
+
+    def _rows(self, ids, weights, evs):
+        """(combo id, weight, ev) of the rows a table has"""
+        if ids is not None:
+            return zip(ids, weights, evs)
+        return ((i, weight, evs[i]) for i, weight in enumerate(weights)
+                if not math.isnan(weight))
+
+    def table_arrays(self, table):
+        """Copies the rows of a table into a TableArrays of the same layout"""
+        from .node_cache import TableArrays
+        views = self._table_views(table)
+        if views is None:
+            return {}
+        if views[0] is None:
+            return TableArrays(array('d', views[1]), array('d', views[2]))
+        return TableArrays(array('d', views[1]), array('d', views[2]), array('i', views[0]))
+
+    def close(self):
+        self.view.release()
+        self.mm.close()
+
+
+if __name__ == '__main__':
+    from .helper_functions import Helper
+    helper = Helper(store="postgres", use_pack=False)
+    pack_dir = __base__.configdict.get("STRATEGY_PACK_DIR")
+    if not os.path.isdir(pack_dir):
+        os.mkdir(pack_dir)
+    for dbname in helper.dbs:
+        with helper.connection(dbname) as conn:
+            num_tables = export_pack(conn.cursor(),
+                                     os.path.join(pack_dir, "{}.pack".format(dbname)))
+        print("Exported {} tables of {}".format(num_tables, dbname))
@@ -0,0 +1,34 @@
+import sys
+import time
+
+
+def measure_startup():
+    """Times a cold import of proc_engine and the construction of Main()"""
+    timings = {}
+    start_time = time.perf_counter()
+    import proc_engine.helper_functions
+    import proc_engine.pokerstarsparser
+    import proc_engine.adda52parser
+    timings["import proc_engine"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    import main
+    timings["import main"] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    main.Main()
+    timings["Main()"] = time.perf_counter() - start_time
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+if __name__ == '__main__':
+    timings = measure_startup()
+    import proc_engine.__base__ as base
+    budget = base.configdict.get("STARTUP_BUDGET_SECONDS")
+    for name, seconds in timings.items():
+        print("{}: {:.3f}s".format(name, seconds))
+    if budget is not None and timings["total"] > budget:
+        print("Startup took {:.3f}s, over the budget of {}s".format(
+            timings["total"], budget))
+        sys.exit(1)
@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from proc_engine.stores import MemoryStore
+from proc_engine.helper_functions import Helper
+
+
+SAMPLE_DIR = os.path.join(ROOT, "sample_files")
+
+
+@pytest.fixture
+def store():
+    return MemoryStore()
+
+
+@pytest.fixture
+def helper(store):
+    """A Helper over an empty MemoryStore, with none of the local files of config.json"""
+    helper = Helper(store=store, moves_tree_file=None, category_file=None,
+                    use_disk_cache=False, use_node_cache=False,
+                    record_access_stats=False, use_async=False)
+    yield helper
+    helper.close()
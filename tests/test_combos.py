@@ -0,0 +1,41 @@
+import random
+from proc_engine import combos
+
+
+def random_hands(rng, count):
+    """4 card hands in the card formats the parsers and solver tables hold, some invalid"""
+    hands = []
+    for i in range(count):
+        cards = rng.sample(combos.CARDS, combos.HAND_SIZE)
+        if rng.random() < 0.5:
+            cards.sort(key=combos.CARD_POSITION.get)
+        if rng.random() < 0.1:
+            cards[0] = cards[0].lower()
+        if rng.random() < 0.05:
+            cards[1] = cards[2]
+        hands.append(rng.choice(["".join(cards), cards]))
+    return hands + [None, "", "AcKd", "AcKdQhJsTc", "XxKdQhJs", "AcKdQhJé"]
+
+
+def python_combo_id(hand):
+    try:
+        return combos.combo_id(hand)
+    except (ValueError, KeyError, TypeError):
+        return -1
+
+
+def test_encode_many_matches_combo_id():
+    hands = random_hands(random.Random(3), 2000)
+    assert combos.encode_many(hands).tolist() == [python_combo_id(hand) for hand in hands]
+
+
+def test_canonical_encode_many_matches_canonical_combo_id():
+    hands = random_hands(random.Random(4), 2000)
+    assert (combos.encode_many(hands, canonical=True).tolist() ==
+            [combos.canonical_combo_id(hand) for hand in hands])
+
+
+def test_decode_many_inverts_encode_many():
+    ids = random.Random(5).sample(range(combos.NUM_COMBOS), 500)
+    assert combos.encode_many(combos.decode_many(ids), canonical=True).tolist() == ids
+    assert len(combos.encode_many([])) == 0
@@ -0,0 +1,53 @@
+import itertools
+import random
+import pytest
+from proc_engine import combos
+from proc_engine.flops import FlopIndex, get_flop_table
+
+
+def linear_scan(helper, flop_cards, flops):
+    """The flop search search_tables did before FlopIndex: (sorted flop, stored flop or None)"""
+    rearranged_flop = helper.rearrange_cards_anti_alphabetically("".join(flop_cards))
+    if rearranged_flop in flops:
+        return rearranged_flop, rearranged_flop
+    for flop in flops:
+        if rearranged_flop[0] == flop[0] and rearranged_flop[2] == flop[2] and rearranged_flop[4] == flop[4]:
+            if helper.find_flop_changes(rearranged_flop, flop) is not None:
+                return rearranged_flop, flop
+    return rearranged_flop, None
+
+
+@pytest.fixture(scope="module")
+def stored_flops():
+    """A sample of the flops, as card tuples, for the flops stored under a node"""
+    rng = random.Random(3)
+    return rng.sample(list(itertools.combinations(combos.CARDS, 3)), 400)
+
+
+def test_match_agrees_with_linear_scan(helper, stored_flops):
+    flops = [helper.rearrange_cards_anti_alphabetically("".join(flop))
+             for flop in stored_flops]
+    index = FlopIndex(get_flop_table(), flops)
+    rng = random.Random(4)
+    queries = stored_flops + rng.sample(list(itertools.combinations(combos.CARDS, 3)), 3000)
+    for flop_cards in queries:
+        flop_cards = rng.sample(list(flop_cards), 3)
+        assert index.match(flop_cards) == linear_scan(helper, flop_cards, flops)
+
+
+def test_remap_cards_agrees_with_change_cards(helper, stored_flops):
+    flops = [helper.rearrange_cards_anti_alphabetically("".join(flop))
+             for flop in stored_flops]
+    index = FlopIndex(get_flop_table(), flops)
+    rng = random.Random(5)
+    checked = 0
+    for flop_cards in itertools.islice(itertools.combinations(combos.CARDS, 3), 0, None, 7):
+        rearranged_flop, stored_flop = index.match(list(flop_cards))
+        if stored_flop is None or stored_flop == rearranged_flop:
+            continue
+        cards = "".join(rng.sample(combos.CARDS, 4))
+        assert (helper.remap_cards(cards, rearranged_flop, stored_flop) ==
+                helper.rearrange_cards_alphabetically(
+                    helper.change_cards(cards, rearranged_flop, stored_flop)))
+        checked += 1
+    assert checked
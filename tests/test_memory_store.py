@@ -0,0 +1,150 @@
+import random
+import pytest
+from proc_engine import combos
+from proc_engine.best_actions import build_node_rows, read_table_rows
+from proc_engine.helper_functions import Helper
+
+
+DBNAME = "PLO50_100BB_6P"
+# run_everything arguments landing in DBNAME
+STACKSIZE, RAKE, PLAYERS = 100, 50, 6
+STORED_FLOP = "KsQh7d"
+MOVES_TREE = {
+    "r": {
+        "c": {"h": ["c", "f", "r", "v"]},
+        "r": {"c": {STORED_FLOP: {"x": {"x": {}, "b": {}}}}},
+    }
+}
+
+
+@pytest.fixture
+def filled_store(store, helper):
+    store.add_moves_tree(DBNAME, MOVES_TREE)
+    cards = helper.rearrange_cards_alphabetically("AsAhKdKc")
+    store.add_rows(DBNAME, "r_c_h_c", [(cards, 3.0, 10.0)])
+    store.add_rows(DBNAME, "r_c_h_f", [(cards, 1.0, 0.0)])
+    store.add_rows(DBNAME, "r_c_h_r", [(cards, 0.0, 12.5)])
+    # Rows of the stored flop, keyed the way a suit isomorphic flop is mapped onto it
+    flop_cards = helper.rearrange_cards_alphabetically(
+        helper.change_cards(cards, "KhQs7d", STORED_FLOP))
+    store.add_rows(DBNAME, "r_r_c_{}_x_x".format(STORED_FLOP), [(flop_cards, 1.0, 4.0)])
+    store.add_rows(DBNAME, "r_r_c_{}_x_b".format(STORED_FLOP), [(flop_cards, 1.0, 6.0)])
+    return store
+
+
+def test_run_everything_normalises_weights(helper, filled_store):
+    result = helper.run_everything("KcAhKdAs", "raise call hero", STACKSIZE, RAKE, PLAYERS)
+    assert result == {"call": {"weight": 0.75, "ev": 10.0},
+                      "fold": {"weight": 0.25, "ev": 0.0},
+                      "raise": {"weight": 0.0, "ev": 12.5}}
+
+
+def test_run_everything_remaps_isomorphic_flop(helper, filled_store):
+    result = helper.run_everything(
+        "AsAhKdKc", "raise raise call KhQs7d check", STACKSIZE, RAKE, PLAYERS)
+    assert result == {"check": {"weight": 0.5, "ev": 4.0},
+                      "bet": {"weight": 0.5, "ev": 6.0}}
+
+
+def test_node_range_matches_run_everything_on_remapped_flop(helper, filled_store):
+    rng = random.Random(7)
+    hands = ["AsAhKdKc"] + ["".join(rng.sample(combos.CARDS, 4)) for i in range(200)]
+    for i, hand in enumerate(hands):
+        stored = helper.rearrange_cards_alphabetically(helper.change_cards(hand, "KhQs7d", STORED_FLOP))
+        filled_store.add_rows(DBNAME, "r_r_c_{}_x_x".format(STORED_FLOP), [(stored, 1.0, i)])
+        filled_store.add_rows(DBNAME, "r_r_c_{}_x_b".format(STORED_FLOP), [(stored, 3.0, -i)])
+    action_sequence = "raise raise call KhQs7d check"
+    node_range = helper.get_node_range(DBNAME, action_sequence)
+    for hand in hands:
+        result = helper.run_everything(hand, action_sequence, STACKSIZE, RAKE, PLAYERS)
+        combo = combos.combo_id(hand)
+        assert {move: {"weight": values["weight"][combo], "ev": values["ev"][combo]}
+                for move, values in node_range.items()} == result
+
+
+def test_run_everything_sorts_remapped_hands_like_the_tables(helper, filled_store):
+    # Mapping KhQs7d onto the stored flop swaps hearts and spades, which puts
+    # AhAs out of order; the tables key hands alphabetically, so the remapped
+    # hand is sorted again and an unsorted key is never read
+    assert helper.change_cards("AhAsKcKd", "KhQs7d", STORED_FLOP) == "AsAhKcKd"
+    filled_store.add_rows(DBNAME, "r_r_c_{}_x_x".format(STORED_FLOP), [("AsAhKcKd", 9.0, -1.0)])
+    result = helper.run_everything(
+        "AhAsKcKd", "raise raise call KhQs7d check", STACKSIZE, RAKE, PLAYERS)
+    assert result == {"check": {"weight": 0.5, "ev": 4.0},
+                      "bet": {"weight": 0.5, "ev": 6.0}}
+
+
+def test_missing_flop_node_raises(helper, filled_store):
+    with pytest.raises(ValueError):
+        helper.run_everything(
+            "AsAhKdKc", "fold call KhQs7d check hero", STACKSIZE, RAKE, PLAYERS)
+
+
+def test_run_many_matches_run_everything(helper, filled_store):
+    decisions = [
+        ("AsAhKdKc", "raise call hero", STACKSIZE, RAKE, PLAYERS),
+        ("2c3c4c5c", "raise call hero", STACKSIZE, RAKE, PLAYERS),
+        ("AsAhKdKc", "raise raise call KhQs7d check", STACKSIZE, RAKE, PLAYERS),
+        ("AsAhKdKc", "call call hero", STACKSIZE, RAKE, PLAYERS),
+        ("AsAhKdKc", "raise call hero", STACKSIZE, RAKE, PLAYERS),
+    ]
+    expected = [helper.run_everything(*decision) for decision in decisions]
+    helper.result_cache.clear()
+    assert helper.run_many(decisions) == expected
+    columns = {field: [decision[i] for decision in decisions] for i, field in enumerate(
+        ["cards", "action_sequence", "stacksize", "rake", "number_of_players"])}
+    helper.result_cache.clear()
+    assert helper.run_many(columns) == expected
+
+
+def test_run_many_keeps_errors_per_decision(helper, filled_store):
+    # Every child weight 0: build_strategy divides by zero normalising them
+    zero_cards = helper.rearrange_cards_alphabetically("2c3c4c5c")
+    for move in "cfr":
+        filled_store.add_rows(DBNAME, "r_c_h_{}".format(move), [(zero_cards, 0.0, 1.0)])
+    good = ("AsAhKdKc", "raise call hero", STACKSIZE, RAKE, PLAYERS)
+    bad = ("2c3c4c5c", "raise call hero", STACKSIZE, RAKE, PLAYERS)
+    expected = helper.run_everything(*good)
+    helper.result_cache.clear()
+    results = helper.run_many([good, bad])
+    assert results[0] == expected
+    assert isinstance(results[1], ZeroDivisionError)
+
+
+def test_node_cache_gives_the_same_results(helper, filled_store):
+    cached = Helper(store=filled_store, moves_tree_file=None, category_file=None,
+                    use_disk_cache=False, use_node_cache=True)
+    for action_sequence in ["raise call hero", "raise raise call KhQs7d check"]:
+        decision = ("AsAhKdKc", action_sequence, STACKSIZE, RAKE, PLAYERS)
+        assert cached.run_everything(*decision) == helper.run_everything(*decision)
+    cached.close()
+
+
+def test_best_actions_need_a_store_with_them(store):
+    with pytest.raises(ValueError):
+        Helper(store=store, use_best_actions=True)
+
+
+def test_memory_store_has_no_best_actions(store):
+    assert not store.has_best_actions
+    assert not hasattr(store, "fetch_best_actions")
+
+
+def test_best_action_rows_hold_the_strategy(helper, filled_store):
+    next_tables = helper.get_table_names_from_db(["r", "c", "h"], ["c", "f", "r"])
+    table_rows = {table: read_table_rows(helper, DBNAME, table) for table in next_tables.values()}
+    rows = list(build_node_rows(helper, "r_c_h", next_tables, table_rows))
+    cards = helper.rearrange_cards_alphabetically("AsAhKdKc")
+    assert rows == [("r_c_h", cards, ["call", "fold", "raise"], [0.75, 0.25, 0.0], [10.0, 0.0, 12.5], "raise", 12.5)]
+
+
+def test_best_action_rows_leave_out_combos_the_lookup_raises_on(helper, filled_store):
+    zero_cards = helper.rearrange_cards_alphabetically("2c3c4c5c")
+    for move in "cfr":
+        filled_store.add_rows(DBNAME, "r_c_h_{}".format(move), [(zero_cards, 0.0, 1.0)])
+    with pytest.raises(ZeroDivisionError):
+        helper.run_everything("2c3c4c5c", "raise call hero", STACKSIZE, RAKE, PLAYERS)
+    next_tables = helper.get_table_names_from_db(["r", "c", "h"], ["c", "f", "r"])
+    table_rows = {table: read_table_rows(helper, DBNAME, table) for table in next_tables.values()}
+    rows = list(build_node_rows(helper, "r_c_h", next_tables, table_rows))
+    assert [row[1] for row in rows] == [helper.rearrange_cards_alphabetically("AsAhKdKc")]
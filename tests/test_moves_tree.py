@@ -0,0 +1,49 @@
+import copy
+import random
+import pytest
+from proc_engine.moves_tree import MovesTree
+
+
+MOVES = ["r", "c", "f", "x", "b", "a"]
+
+
+def random_document(rng, depth=4):
+    """A moves_tree style document: move -> subtree, "h" -> list of next moves"""
+    document = {}
+    for move in rng.sample(MOVES, rng.randint(1, 4)):
+        if depth > 1 and rng.random() < 0.7:
+            document[move] = random_document(rng, depth - 1)
+        else:
+            document[move] = {"h": rng.sample(MOVES, rng.randint(1, 4)) + ["v"]}
+    if rng.random() < 0.3:
+        document["h"] = rng.sample(MOVES, rng.randint(1, 3))
+    return document
+
+
+def document_paths(document, path=()):
+    for key, value in document.items():
+        yield list(path) + [key]
+        if isinstance(value, dict):
+            for sub_path in document_paths(value, path + (key,)):
+                yield sub_path
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_search_matches_search_dict(helper, seed):
+    rng = random.Random(seed)
+    document = random_document(rng)
+    tree = MovesTree(document)
+    paths = list(document_paths(document))
+    # Paths that leave the tree, and paths going on after an "h" list
+    paths += [path + [rng.choice(MOVES)] for path in paths if path[-1] != "h"]
+    paths += [path + ["r", "c"] for path in paths if path[-1] == "h"]
+    for path in paths:
+        expected = helper.search_dict(list(path), copy.deepcopy(document))
+        assert tree.search(path) == expected, path
+
+
+def test_search_skips_mongo_id(helper):
+    document = {"_id": "abc", "r": {"h": ["c", "f", "v"]}}
+    assert MovesTree(document).search(["_id"]) is None
+    assert MovesTree(document).search(["r", "h"]) == ["c", "f"]
+
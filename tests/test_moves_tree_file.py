@@ -0,0 +1,69 @@
+import random
+import pytest
+from test_moves_tree import random_document, document_paths
+from proc_engine.helper_functions import Helper
+from proc_engine.moves_tree import MovesTree, MovesTreeFile, document_version, save_trees, stale_trees
+from proc_engine.stores import MemoryStore
+
+
+def test_tree_file_round_trip(tmp_path):
+    rng = random.Random(7)
+    document = random_document(rng)
+    path = str(tmp_path / "trees.bin")
+    save_trees({"db": MovesTree(document)}, path, {"db": "v1"})
+    tree_file = MovesTreeFile(path)
+    assert tree_file.versions == {"db": "v1"}
+    for keys in document_paths(document):
+        assert tree_file.trees["db"].search(keys) == MovesTree(document).search(keys)
+
+
+def test_tree_file_rejects_corruption(tmp_path):
+    path = str(tmp_path / "trees.bin")
+    save_trees({"db": MovesTree({"r": {"h": ["c", "f"]}})}, path)
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    data[-1] ^= 1
+    with open(path, "wb") as f:
+        f.write(data)
+    with pytest.raises(ValueError):
+        MovesTreeFile(path, verify=True)
+    assert stale_trees(path, {"db": {"r": {"h": ["c", "f"]}}}) == ["db"]
+
+
+def test_stale_trees_finds_changed_documents(tmp_path):
+    path = str(tmp_path / "trees.bin")
+    documents = {"a": {"r": {"h": ["c", "f"]}}, "b": {"c": {"h": ["f"]}}}
+    save_trees({dbname: MovesTree(document) for dbname, document in documents.items()}, path,
+               {dbname: document_version(document) for dbname, document in documents.items()})
+    assert stale_trees(path, documents) == []
+    documents["b"] = {"c": {"h": ["f", "r"]}}
+    documents["c"] = {}
+    assert stale_trees(path, documents) == ["b", "c"]
+
+
+class CountingStore(MemoryStore):
+
+    def __init__(self):
+        super().__init__()
+        self.document_reads = 0
+
+    def get_moves_document(self, dbname):
+        self.document_reads += 1
+        return super().get_moves_document(dbname)
+
+
+def test_tree_file_is_read_without_the_store(tmp_path):
+    dbname = "PLO50_100BB_6P"
+    store = CountingStore()
+    store.add_moves_tree(dbname, {"r": {"h": ["c", "f"]}})
+    path = str(tmp_path / "trees.bin")
+    save_trees({dbname: MovesTree({"r": {"h": ["c", "f"]}})}, path)
+    helper = Helper(store=store, moves_tree_file=path, category_file=None,
+                    use_disk_cache=False, record_access_stats=False, use_async=False)
+    assert helper.search_moves(["r", "h"], dbname) == ["c", "f"]
+    assert helper.get_moves_tree(dbname) is helper._tree_file.trees[dbname]
+    assert store.document_reads == 0
+    # A dbname the file does not have comes from the store
+    assert helper.search_moves(["r", "h"], "PLO50_50BB_6P") is None
+    assert store.document_reads == 1
+    helper.close()
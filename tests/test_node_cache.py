@@ -0,0 +1,69 @@
+import math
+import random
+import numpy as np
+from proc_engine import combos
+from proc_engine.node_cache import NodeCache, TableArrays
+from proc_engine.node_ranges import table_vectors
+
+
+def dense_table(rows):
+    """The TableArrays of rows as it was always built, over every combo id"""
+    table = TableArrays()
+    for combo, weight, ev in rows:
+        i = combos.canonical_combo_id(combo)
+        if i < 0:
+            table.extra.setdefault(combo, (weight, ev))
+        elif math.isnan(table.weights[i]):
+            table.weights[i] = weight
+            table.evs[i] = ev
+    return table
+
+
+def random_rows(rng, count):
+    ids = rng.sample(range(combos.NUM_COMBOS), count)
+    rows = [(combo, rng.random(), rng.uniform(-100, 100)) for combo in combos.decode_many(ids)]
+    # A duplicate combo, and a combo not written in canonical order
+    return rows + [(rows[0][0], 0.5, 1.0), ("AsAhAdAc", 0.25, 2.0)]
+
+
+def test_small_tables_are_sparse():
+    rng = random.Random(7)
+    rows = random_rows(rng, 500)
+    table = TableArrays.from_rows(rows)
+    dense = dense_table(rows)
+    assert table.ids is not None
+    assert table.nbytes < dense.nbytes / 100
+    lookups = [row[0] for row in rows] + combos.decode_many(rng.sample(range(combos.NUM_COMBOS), 500))
+    assert [table.get(combo) for combo in lookups] == [dense.get(combo) for combo in lookups]
+    for vector, dense_vector in zip(table_vectors(table), table_vectors(dense)):
+        assert np.array_equal(vector, dense_vector, equal_nan=True)
+
+
+def test_tables_holding_most_combos_are_dense():
+    rows = random_rows(random.Random(8), combos.NUM_COMBOS * 9 // 10)
+    table = TableArrays.from_rows(rows)
+    assert table.ids is None
+    assert table.nbytes == dense_table(rows).nbytes
+
+
+def test_node_too_large_for_the_cache_is_fetched_per_combo():
+    rows = random_rows(random.Random(9), 500)
+    loads = []
+    fetches = []
+
+    def load_table(dbname, table):
+        loads.append(table)
+        return TableArrays.from_rows(rows)
+
+    def fetch_rows(dbname, tables, combos):
+        fetches.append(list(combos))
+        return {table: {} for table in tables}
+
+    cache = NodeCache(load_table, fetch_rows, max_bytes=TableArrays.from_rows(rows).nbytes)
+    tables = ["r_h_c", "r_h_f"]
+    # Loaded whole once, which shows the node does not fit
+    assert cache.get_node("db", "r_h", tables, [rows[0][0]])["r_h_c"].get(rows[0][0]) == rows[0][1:]
+    assert not cache.has_node("db", "r_h")
+    assert cache.get_node("db", "r_h", tables, [rows[1][0]]) == {"r_h_c": {}, "r_h_f": {}}
+    assert loads == tables
+    assert fetches == [[rows[1][0]]]
@@ -0,0 +1,82 @@
+import math
+import random
+import pytest
+from proc_engine.scoring import EV_SCALE, result_moves, score_decisions
+
+
+CORRECT_TERMS = ["Correct", "EV Loss"]
+COLUMNS = ["Result", "Stack Size", "Big Blind", "Player's Move", "GTO Move",
+           "Amount Won in Terms of BB", "Move EV", "GTO EV"]
+
+
+def random_result(rng):
+    """A solver result whose evs often tie within the tolerance of best_action"""
+    moves = rng.sample(["raise", "call", "fold", "check", "all_in"], rng.randint(1, 5))
+    base = rng.uniform(-500, 500)
+    return {move: {"weight": rng.random(),
+                   "ev": base + rng.choice([0, 0.00005, -0.00005, rng.uniform(-50, 50)])}
+            for move in moves}
+
+
+def best_action(res_dict):
+    """The GTO move and its EV as the parsers picked them: the last move within 0.0001 of the highest EV"""
+    gto_move = None
+    highest_ev = max([res_dict[key]["ev"] for key in res_dict])
+    for key, val in res_dict.items():
+        if highest_ev - val["ev"] < 0.0001:
+            gto_move = key
+    return gto_move, highest_ev
+
+
+def old_row(row, res_dict):
+    """A report row the way the parsers built it one decision at a time"""
+    gto_move, highest_ev = best_action(res_dict)
+    players_move = row["Player's Move"]
+    bigblind = row["bigblind"]
+    move_ev = res_dict.get(players_move, {}).get("ev", None)
+    if move_ev is not None:
+        move_ev = move_ev / EV_SCALE
+    return {
+        "Result": CORRECT_TERMS[0] if players_move == gto_move else CORRECT_TERMS[1],
+        "Stack Size": row["stacksize"] / bigblind,
+        "Big Blind": "{}/{}".format(int(bigblind / 2), int(bigblind)),
+        "Player's Move": players_move,
+        "GTO Move": gto_move,
+        "Amount Won in Terms of BB": row["amount_won"] / bigblind,
+        "Move EV": move_ev,
+        "GTO EV": highest_ev
+    }
+
+
+def test_score_decisions_matches_best_action():
+    rng = random.Random(11)
+    rows = []
+    results = []
+    for i in range(500):
+        res_dict = random_result(rng)
+        rows.append({
+            "Player's Move": rng.choice(list(res_dict) + ["fold", "bet"]),
+            "bigblind": rng.choice([2, 10, 50, 100]),
+            "stacksize": rng.uniform(50, 20000),
+            "amount_won": rng.uniform(-5000, 5000)})
+        results.append(res_dict)
+    df = score_decisions(rows, [result_moves(res_dict) for res_dict in results],
+                         CORRECT_TERMS, COLUMNS)
+    for scored, row, res_dict in zip(df.to_dict("records"), rows, results):
+        expected = old_row(row, res_dict)
+        for column in COLUMNS:
+            if expected[column] is None:
+                assert math.isnan(scored[column])
+            elif isinstance(expected[column], float):
+                assert scored[column] == pytest.approx(expected[column])
+            else:
+                assert scored[column] == expected[column]
+
+
+def test_score_decisions_without_decisions():
+    assert score_decisions([], [], CORRECT_TERMS, COLUMNS).empty
+
+
+def test_result_moves_rejects_empty_result():
+    with pytest.raises(ValueError):
+        result_moves({})
@@ -0,0 +1,244 @@
+import os
+import re
+import pytest
+from conftest import SAMPLE_DIR
+from proc_engine.adda52parser import Adda52Parser
+from proc_engine.pokerstarsparser import PokerStarsParser
+from proc_engine import parallel
+from proc_engine.access_stats import AccessStats
+from proc_engine.parallel import run_chunks
+
+
+POKERSTARS_FILE = os.path.join(SAMPLE_DIR, "pokerstars_test.txt")
+ADDA52_FILE = os.path.join(SAMPLE_DIR, "adda52_test.txt")
+
+
+def readlines_pokerstars_segments(filename):
+    """PokerStarsParser.process_file as it was, over the whole file read with readlines"""
+    with open(filename, 'r') as f:
+        file_lines = f.readlines()
+    current_segment = []
+    segments = []
+    file_len = len(file_lines)
+    for i, line in enumerate(file_lines):
+        if i < file_len - 1 and (file_lines[i] == '\n'):
+            if len(current_segment):
+                segments.append(current_segment)
+            current_segment = []
+            continue
+        current_segment.append(line)
+    return segments
+
+
+def readlines_adda52_segments(filepath):
+    """Adda52Parser.get_file_segments as it was, over the whole file read with readlines"""
+    with open(filepath) as f:
+        file_contents = f.readlines()
+    segments = []
+    info_lines = []
+    preflop_lines = []
+    winner_lines = []
+    flag = 1
+    for line in file_contents:
+        if line == '\n':
+            continue
+        if "*****" in line:
+            if len(info_lines) and len(preflop_lines):
+                segments.append([info_lines, preflop_lines, winner_lines])
+                flag = 1
+                info_lines = []
+                preflop_lines = []
+                winner_lines = []
+        if flag:
+            if ":" in line:
+                info_lines.append(line)
+            else:
+                preflop_lines.append(line)
+        if "Flop Cards" in line:
+            flag = 0
+        if "Winner" in line:
+            winner_lines.append(line)
+    return segments
+
+
+def readlines_heroname(parser, filepath):
+    """Adda52Parser.get_heroname as it was, a second pass over the file"""
+    with open(filepath) as f:
+        for line in f.readlines():
+            if "My Cards" in line:
+                current_cards = set(parser.get_holecards(line))
+            if "Winner" in line:
+                winner_cards = set(parser.get_holecards(line))
+                if len(winner_cards):
+                    if len(current_cards.intersection(set(winner_cards))):
+                        return re.findall(r'\w+', line)[2]
+
+
+@pytest.mark.parametrize("text", [
+    "a\nb\n\nc\n",
+    "a\n\n\nb\n\n",
+    "\n\na\nb\n",
+    "a\nb\n\n",
+    "a\n\nb",
+    "",
+])
+def test_pokerstars_segments_edge_cases(helper, tmp_path, text):
+    path = str(tmp_path / "hands.txt")
+    with open(path, "w") as f:
+        f.write(text)
+    parser = PokerStarsParser(helper=helper)
+    assert list(parser.process_file(path)) == readlines_pokerstars_segments(path)
+
+
+def test_pokerstars_segments_match_readlines(helper):
+    parser = PokerStarsParser(helper=helper)
+    segments = list(parser.process_file(POKERSTARS_FILE))
+    assert len(segments)
+    assert segments == readlines_pokerstars_segments(POKERSTARS_FILE)
+
+
+def test_adda52_segments_match_readlines(helper):
+    parser = Adda52Parser(helper=helper)
+    segments = list(parser.get_file_segments(ADDA52_FILE))
+    assert len(segments)
+    assert segments == readlines_adda52_segments(ADDA52_FILE)
+
+
+def test_adda52_heroname_found_while_streaming(helper):
+    parser = Adda52Parser(helper=helper)
+    segments = parser.get_file_segments(ADDA52_FILE)
+    read = 0
+    for segment in segments:
+        read += 1
+        if parser.heroname is not None:
+            break
+    # Known long before the end of the file
+    assert read < len(readlines_adda52_segments(ADDA52_FILE))
+    assert parser.heroname == readlines_heroname(parser, ADDA52_FILE)
+
+
+def test_serial_run_starts_before_the_file_is_read(helper):
+    parser = PokerStarsParser(helper=helper, processes=1, chunk_size=10)
+    read = []
+    processed = []
+
+    def segments():
+        for segment in parser.process_file(POKERSTARS_FILE):
+            read.append(segment)
+            yield segment
+
+    def process_chunk(chunk):
+        processed.append(len(read))
+        return [(k, []) for k, segment in chunk]
+
+    parser.process_chunk = process_chunk
+    outcomes = list(run_chunks(parser, segments()))
+    assert [k for k, outcome in outcomes] == list(range(len(read)))
+    # Each chunk runs as soon as its hands are read
+    assert processed == [min(10 * (i + 1), len(read)) for i in range(len(processed))]
+
+
+class RecordingParser(object):
+    """A parser whose chunks only record a lookup per hand"""
+
+    def __init__(self, helper):
+        self.helper = helper
+
+    def process_chunk(self, chunk):
+        for k, segment in chunk:
+            self.helper.record_access("db", segment)
+        return [(k, []) for k, segment in chunk]
+
+
+def test_pool_worker_flushes_access_stats_per_chunk(store, tmp_path):
+    path = str(tmp_path / "access_stats.sqlite")
+    parallel._init_worker(RecordingParser, {}, dict(
+        store=store, moves_tree_file=None, category_file=None, use_disk_cache=False,
+        record_access_stats=True, access_stats_file=path))
+    try:
+        parallel._process_chunk([(0, "r_h"), (1, "r_h"), (2, "c_h")])
+        # As another process reads them, while the worker is still alive
+        assert AccessStats(path).hottest() == [("db", "r_h", 2, 0), ("db", "c_h", 1, 0)]
+    finally:
+        parallel.get_worker_parser().helper.close()
+        parallel._worker.clear()
+
+
+def test_one_bad_hand_only_drops_its_rows(helper, store):
+    parser = PokerStarsParser(helper=helper, processes=1, chunk_size=10)
+    segments = list(parser.process_file(POKERSTARS_FILE))[:3]
+    lookups = [decision["lookup"] for segment in segments
+               for decision in parser.get_section_decisions(segment)]
+    assert [lookup[1] for lookup in lookups] == [
+        "fold hero", "fold fold fold raise call hero", "fold hero"]
+    dbname = helper.get_dbname(*lookups[0][2:])
+    store.add_moves_tree(dbname, {"f": {
+        "h": ["c", "f", "r"],
+        "f": {"f": {"r": {"c": {"h": ["c", "f", "r"]}}}}}})
+    for move in "cfr":
+        store.add_rows(dbname, "f_h_{}".format(move), [
+            (helper.rearrange_cards_alphabetically(lookups[i][0]), 1.0, 2.0) for i in (0, 2)])
+        # Every child weight 0 for the second hand
+        store.add_rows(dbname, "f_f_f_r_c_h_{}".format(move), [
+            (helper.rearrange_cards_alphabetically(lookups[1][0]), 0.0, 2.0)])
+    outcomes = list(run_chunks(parser, segments))
+    assert [k for k, outcome in outcomes] == [0, 1, 2]
+    assert len(outcomes[0][1]) == len(outcomes[2][1]) == 1
+    assert outcomes[1][1].startswith("Error in iteration 1")
+
+
+def test_failed_batch_reports_the_hands_of_the_chunk(helper):
+    parser = PokerStarsParser(helper=helper, processes=1, chunk_size=10)
+    segments = list(parser.process_file(POKERSTARS_FILE))[:3]
+
+    def run_many(decisions):
+        raise ConnectionError("store down")
+
+    helper.run_many = run_many
+    assert parser.process_chunk(list(enumerate(segments))) == [
+        (k, "Error in iteration {}: store down".format(k)) for k in range(3)]
+
+
+def test_shared_run_publishes_the_trees_of_the_first_chunk(helper, monkeypatch):
+    from proc_engine.shared_data import SharedData
+    parser = PokerStarsParser(helper=helper, processes=2, chunk_size=3, share_data=True)
+    segments = list(parser.process_file(POKERSTARS_FILE))
+    published = []
+
+    class Published(object):
+        manifest = {}
+
+        def close(self):
+            pass
+
+    def publish(helper, dbnames=None):
+        published.append(dbnames)
+        return Published()
+
+    monkeypatch.setattr(SharedData, "publish", publish)
+    monkeypatch.setattr(parallel, "process_in_pool", lambda parser_class, segments, *args, **kwargs: (
+        (k, segment) for k, segment in enumerate(segments)))
+    outcomes = list(run_chunks(parser, iter(segments)))
+    assert published == [["PLO500_150BB_6P"]]
+    # Hands read for the dbnames still all go to the pool
+    assert [segment for k, segment in outcomes] == segments
+
+
+class LengthParser(object):
+    """A parser whose chunks report the length of each hand and the process it ran in"""
+
+    def __init__(self, helper):
+        self.helper = helper
+
+    def process_chunk(self, chunk):
+        return [(k, (len(segment), os.getpid())) for k, segment in chunk]
+
+
+def test_pool_runs_chunks_in_started_processes():
+    segments = [["line"] * n for n in range(1, 8)]
+    outcomes = list(parallel.process_in_pool(
+        LengthParser, iter(segments), 2, 3, helper_kwargs=dict(
+            store="memory", moves_tree_file=None, category_file=None,
+            use_disk_cache=False, record_access_stats=False)))
+    assert [(k, length) for k, (length, pid) in outcomes] == [(k, k + 1) for k in range(7)]
+    assert os.getpid() not in {pid for k, (length, pid) in outcomes}
@@ -0,0 +1,14 @@
+import subprocess
+import sys
+from conftest import ROOT
+
+
+def test_importing_the_parsers_leaves_the_heavy_modules_out():
+    # A fresh interpreter, the test session has them all loaded already
+    loaded = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, proc_engine.pokerstarsparser, proc_engine.adda52parser\n"
+         "print(' '.join(m for m in ('sqlite3', 'asyncio', 'numpy', 'pandas', 'multiprocessing')"
+         " if m in sys.modules))"],
+        cwd=ROOT, capture_output=True, text=True, check=True).stdout.split()
+    assert loaded == []
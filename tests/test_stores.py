@@ -0,0 +1,180 @@
+import sys
+import types
+import pytest
+from proc_engine.best_actions import build_best_action_table
+from proc_engine.stores import ConsolidatedPostgresStore, PostgresMongoStore
+from proc_engine.strategy_pack import StrategyPack, export_pack
+
+
+class FakeCursor(object):
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=None):
+        self.conn.queries.append(query)
+        self.conn.params.append(params)
+
+    def fetchall(self):
+        return self.conn.results
+
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.autocommit = False
+        self.closed = 0
+        self.queries = []
+        self.params = []
+        self.results = []
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.queries.append("ROLLBACK" if exc_type else "COMMIT")
+
+
+class FakePool(object):
+    """Keeps returned connections the way psycopg2's AbstractConnectionPool._putconn does"""
+
+    def __init__(self, minconn, maxconn, dsn):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle = [FakeConnection() for i in range(minconn)]
+        self.opened = minconn
+
+    def getconn(self):
+        if len(self.idle):
+            return self.idle.pop()
+        self.opened += 1
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        if len(self.idle) < self.minconn and not close:
+            self.idle.append(conn)
+        else:
+            conn.close()
+
+    def closeall(self):
+        for conn in self.idle:
+            conn.close()
+
+
+@pytest.fixture
+def postgres_store(monkeypatch):
+    psycopg2 = types.ModuleType("psycopg2")
+    psycopg2.pool = types.ModuleType("psycopg2.pool")
+    psycopg2.pool.ThreadedConnectionPool = FakePool
+    monkeypatch.setitem(sys.modules, "psycopg2", psycopg2)
+    monkeypatch.setitem(sys.modules, "psycopg2.pool", psycopg2.pool)
+    store = PostgresMongoStore({}, pool_size=2)
+    yield store
+    store.close()
+
+
+def test_lookups_reuse_a_pooled_connection(postgres_store):
+    used = []
+    for i in range(3):
+        with postgres_store.connection("db") as conn:
+            used.append(conn)
+    assert used[0] is used[1] is used[2]
+    assert not used[0].closed
+    assert postgres_store.get_pool("db").opened == 1
+
+
+def test_connections_opened_for_concurrent_lookups_stay_open(postgres_store):
+    with postgres_store.connection("db") as first:
+        with postgres_store.connection("db") as second:
+            pass
+    assert postgres_store.get_pool("db").opened == 2
+    assert not first.closed and not second.closed
+    with postgres_store.connection("db") as conn:
+        assert conn in (first, second)
+
+
+def test_second_lookup_reuses_the_prepared_statement(postgres_store):
+    postgres_store.fetch_table_rows("db", "r_c_h_c", ["AcAdAhAs"])
+    postgres_store.fetch_table_rows("db", "r_c_h_c", ["KcKdKhKs"])
+    with postgres_store.connection("db") as conn:
+        queries = conn.queries
+    assert len([query for query in queries if query.startswith("PREPARE")]) == 1
+    assert len([query for query in queries if query.startswith("EXECUTE")]) == 2
+
+
+def test_no_statement_is_prepared_without_a_limit(postgres_store):
+    postgres_store.max_prepared_statements = 0
+    postgres_store.fetch_table_rows("db", "r_c_h_c", ["AcAdAhAs"])
+    postgres_store.fetch_table_rows("db", "r_c_h_c", ["KcKdKhKs"])
+    with postgres_store.connection("db") as conn:
+        queries, params = conn.queries, conn.params
+    assert not [query for query in queries if query.startswith(("PREPARE", "EXECUTE"))]
+    assert len(queries) == 2
+    assert "%(p1)s::text[]" in queries[0] and "$" not in queries[0]
+    assert params == [{"p1": ["AcAdAhAs"]}, {"p1": ["KcKdKhKs"]}]
+
+
+def test_table_names_leave_out_the_non_solver_tables(postgres_store):
+    with postgres_store.connection("db") as conn:
+        conn.results = [("best_actions",), ("r_c_h_c",), ("solver_nodes",),
+                        ("strategy_rows",), ("r_c_h_f",)]
+    assert postgres_store.get_table_names("db") == ["r_c_h_c", "r_c_h_f"]
+
+
+def test_pack_export_quotes_the_table_names(tmp_path):
+    conn = FakeConnection()
+    cursor = conn.cursor()
+    cursor.fetchall = lambda: ([('r_"c"',)] if conn.queries[-1].startswith("SELECT table_name")
+                               else [("AcAdAhAs", "AcAdAhAs", 1.0, 2.0)])
+    path = str(tmp_path / "db.pack")
+    assert export_pack(cursor, path) == 1
+    assert conn.queries[-1] == 'SELECT combo, * FROM "r_""c""";'
+    assert StrategyPack(path).fetch_table_rows('r_"c"', ["AcAdAhAs"]) == {"AcAdAhAs": (1.0, 2.0)}
+
+
+def test_version_covers_only_the_solver_tables(postgres_store):
+    with postgres_store.connection("db") as conn:
+        conn.results = [("stamp",)]
+    assert postgres_store.get_version("db") == "stamp"
+    assert "n_tup_upd" in conn.queries[-1]
+    assert "NOT c.relname = ANY(%s)" in conn.queries[-1]
+    assert conn.params[-1] == (["solver_nodes", "strategy_rows", "best_actions", "best_actions_staging"],)
+    # The consolidated store reads its strategies from those two tables only
+    assert ConsolidatedPostgresStore.version_condition == (
+        "c.relname = ANY(%s)", ["solver_nodes", "strategy_rows"])
+
+
+def test_best_action_rebuild_swaps_in_a_staging_table(helper, store, monkeypatch):
+    dbname = "PLO50_100BB_6P"
+    store.add_moves_tree(dbname, {"r": {"h": ["c", "f"]}})
+    store.add_rows(dbname, "r_h_c", [("AcAdAhAs", 1.0, 2.0)])
+    store.add_rows(dbname, "r_h_f", [("AcAdAhAs", 1.0, 0.0)])
+    extras = types.ModuleType("psycopg2.extras")
+    extras.execute_values = lambda cursor, query, rows: cursor.execute(query, rows)
+    monkeypatch.setitem(sys.modules, "psycopg2.extras", extras)
+    conn = FakeConnection()
+    conn.autocommit = True
+    assert build_best_action_table(helper, dbname, conn) == 1
+    assert not conn.autocommit
+    assert conn.params[conn.queries.index("INSERT INTO best_actions_staging VALUES %s")] == [
+        ("r_h", "AcAdAhAs", ["call", "fold"], [0.5, 0.5], [2.0, 0.0], "call", 2.0)]
+    # The live table is only touched by the swap, in the same transaction as the build
+    assert conn.queries[-5:] == [
+        "ANALYZE best_actions_staging;",
+        "DROP TABLE IF EXISTS best_actions;",
+        "ALTER TABLE best_actions_staging RENAME TO best_actions;",
+        "ALTER INDEX best_actions_staging_pkey RENAME TO best_actions_pkey;",
+        "COMMIT"]
+    assert "DROP TABLE IF EXISTS best_actions;" not in conn.queries[:-4]
@@ -0,0 +1,27 @@
+from proc_engine.helper_functions import Helper
+from proc_engine.node_cache import table_size
+
+
+DBNAME = "PLO50_100BB_6P"
+# Preflop nodes, hottest first
+NODES = ["r_h", "c_h", "f_h", "x_h"]
+
+
+def test_warm_up_keeps_the_hottest_nodes_in_budget(store, tmp_path):
+    store.add_moves_tree(DBNAME, {node[0]: {"h": ["c", "f"]} for node in NODES})
+    for node in NODES:
+        store.add_rows(DBNAME, node + "_c", [("AcAdAhAs", 1.0, 2.0)])
+        store.add_rows(DBNAME, node + "_f", [("AcAdAhAs", 0.0, 0.0)])
+    node_size = sum(table_size(store.load_table_arrays(DBNAME, "r_h_" + move))
+                    for move in ["c", "f"])
+    helper = Helper(store=store, moves_tree_file=None, category_file=None,
+                    use_disk_cache=False, use_node_cache=True,
+                    node_cache_bytes=2.5 * node_size, record_access_stats=True,
+                    access_stats_file=str(tmp_path / "access_stats.sqlite"))
+    for i, node in enumerate(NODES):
+        for j in range(len(NODES) - i):
+            helper.access_stats.record(DBNAME, node)
+    assert helper.warm_up() == 2
+    cached = [node for node in NODES if helper.node_cache.has_node(DBNAME, node)]
+    assert cached == NODES[:2]
+    helper.close()